@@ -0,0 +1,71 @@
+"""Broadcast fan-out benchmark.
+
+Compares the encode-once adapter against per-recipient encoding.
+
+    python -m benchmarks.broadcast [recipients ...]
+"""
+from benchmarks.common import Timer, connect
+from pysocketio import Engine
+from pysocketio.adapter import Adapter
+import pysocketio_parser as parser
+
+import sys
+
+DEFAULT_COUNTS = [1000, 10000, 50000]
+
+
+class PerRecipientAdapter(Adapter):
+    """Baseline, every recipient encodes the packet itself."""
+
+    def broadcast(self, packet, options):
+        excluded = options.get('except') or []
+        flags = options.get('flags') or {}
+
+        for socket in self.recipients(options.get('rooms'), excluded):
+            socket.packet(dict(packet), False, flags.get('volatile'))
+
+
+class EncodeCounter(object):
+    def __init__(self):
+        self.count = 0
+        self.original = parser.Encoder.encode
+
+    def __enter__(self):
+        counter = self
+
+        def encode(encoder, packet, callback):
+            counter.count += 1
+            return counter.original(encoder, packet, callback)
+
+        parser.Encoder.encode = encode
+        return self
+
+    def __exit__(self, *args):
+        parser.Encoder.encode = self.original
+
+
+def run(adapter, count):
+    engine = Engine({'adapter': adapter})
+    connect(engine, count)
+
+    with EncodeCounter() as counter:
+        with Timer() as timer:
+            engine.emit('message', {'username': 'bench', 'message': 'hello'})
+
+    return counter.count, timer.elapsed
+
+
+def main(counts):
+    print('%-22s %10s %10s %10s' % ('adapter', 'recipients', 'encodes', 'seconds'))
+
+    for count in counts:
+        for adapter in [PerRecipientAdapter, Adapter]:
+            encodes, elapsed = run(adapter, count)
+
+            print('%-22s %10d %10d %10.4f' % (
+                adapter.__name__, count, encodes, elapsed
+            ))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or DEFAULT_COUNTS)
@@ -0,0 +1,84 @@
+from pyemitter import Emitter
+import gc
+import resource
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class FakeRequest(object):
+    def __init__(self, query=None, headers=None):
+        self.query = query or {}
+        self.headers = headers or {}
+
+
+class FakeTransport(Emitter):
+    def __init__(self):
+        self.writable = True
+
+
+class FakeConnection(Emitter):
+    def __init__(self, sid, request=None):
+        """Stand-in for an engine.io socket, records written frames.
+
+        :param sid: Session id
+        :type sid: str
+        """
+        self.sid = sid
+        self.request = request or FakeRequest()
+        self.transport = FakeTransport()
+
+        self.ready_state = 'open'
+        self.written = 0
+
+    def write(self, data):
+        self.written += 1
+
+    def close(self):
+        self.ready_state = 'closed'
+
+
+def connect(engine, count, prefix='c'):
+    """Connects `count` fake clients to `engine`, returns the connections."""
+    connections = []
+
+    for x in range(count):
+        conn = FakeConnection('%s%d' % (prefix, x))
+        engine.on_connection(conn)
+
+        connections.append(conn)
+
+    return connections
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.time() - self.start
+
+
+def percentile(values, fraction):
+    """Retrieves the `fraction` (0..1) percentile of `values`."""
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def memory_usage():
+    """Retrieves the bytes currently allocated by the process (traced
+       allocations when `tracemalloc` is running, resident size otherwise)."""
+    gc.collect()
+
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * resource.getpagesize()
@@ -0,0 +1,89 @@
+"""Websocket compression benchmark.
+
+Reports bytes on the wire and CPU time per delivered message for chat
+style JSON broadcasts, uncompressed and with each permessage-deflate
+mode (headers excluded).
+
+    python -m benchmarks.compression [recipients] [messages]
+"""
+from pysocketio.compression import Deflate
+
+import json
+import random
+import sys
+import time
+
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+DEFAULT_RECIPIENTS = 100
+DEFAULT_MESSAGES = 1000
+
+WORDS = [
+    'hello', 'world', 'socket', 'message', 'room', 'user', 'joined', 'left',
+    'typing', 'online', 'status', 'update', 'channel', 'event', 'reply'
+]
+
+MODES = [
+    ('none', None),
+    ('stateless', {'context_takeover': False, 'cache_size': 0}),
+    ('compress-once', {'context_takeover': False}),
+    ('takeover', {'context_takeover': True})
+]
+
+
+def messages(count):
+    generator = random.Random(0)
+
+    for x in range(count):
+        yield ('42' + json.dumps(['message', {
+            'id': x,
+            'username': 'user%d' % generator.randint(0, 50),
+            'room': 'general',
+            'message': ' '.join(generator.choice(WORDS) for y in range(generator.randint(5, 60))),
+            'timestamp': 1500000000 + x
+        }], separators=(',', ':'))).encode('utf-8')
+
+
+def run(options, recipients, frames):
+    if options is None:
+        return sum(len(frame) for frame in frames) * recipients, 0
+
+    deflate = Deflate(threshold=0, **options)
+    params = deflate.accept({})[1]
+
+    compressors = [deflate.compressor(params) for x in range(recipients)]
+
+    size = 0
+    started = cpu_time()
+
+    for frame in frames:
+        for compressor in compressors:
+            size += len(compressor.compress(frame))
+
+    return size, cpu_time() - started
+
+
+def main(recipients, count):
+    frames = list(messages(count))
+    delivered = float(recipients * count)
+
+    print('%-14s %14s %12s %14s' % ('mode', 'bytes/message', 'ratio', 'cpu us/message'))
+
+    raw = None
+
+    for name, options in MODES:
+        size, elapsed = run(options, recipients, frames)
+
+        if raw is None:
+            raw = size
+
+        print('%-14s %14.1f %12.3f %14.2f' % (
+            name, size / delivered, size / float(raw), elapsed / delivered * 1000000
+        ))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECIPIENTS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MESSAGES
+    )
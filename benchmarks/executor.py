@@ -0,0 +1,83 @@
+"""Handler executor benchmark.
+
+Reports the latency of cheap events sent every millisecond while
+another client sends CPU-heavy (zlib) events, with the heavy handler
+running inline and in each executor.
+
+    python -m benchmarks.executor [seconds]
+"""
+from benchmarks.common import connect, percentile
+from pysocketio import Engine
+from pysocketio.executor import GreenletExecutor, ProcessExecutor, ThreadExecutor
+from pysocketio.metrics import clock
+
+import gevent
+import os
+import sys
+import zlib
+
+DEFAULT_DURATION = 5.0
+
+CHEAP_INTERVAL = 0.001
+HEAVY_INTERVAL = 0.05
+
+PAYLOAD = os.urandom(256 * 1024) * 4
+
+
+def heavy(*args):
+    return len(zlib.compress(PAYLOAD, 9))
+
+
+def run(executor, duration):
+    engine = Engine()
+    latencies = []
+
+    @engine.route('cheap')
+    def on_cheap(socket, due):
+        latencies.append(clock() - due)
+
+    engine.route('heavy', heavy, executor=executor)
+
+    cheap, expensive = connect(engine, 2)
+    end = clock() + duration
+
+    def send_cheap():
+        due = clock()
+
+        while due < end:
+            gevent.sleep(max(due - clock(), 0))
+            cheap.emit('data', '2["cheap",%r]' % due)
+
+            due += CHEAP_INTERVAL
+
+    def send_heavy():
+        while clock() < end:
+            expensive.emit('data', '2["heavy"]')
+            gevent.sleep(HEAVY_INTERVAL)
+
+    gevent.joinall([gevent.spawn(send_cheap), gevent.spawn(send_heavy)])
+
+    return latencies
+
+
+def main(duration):
+    print('%-10s %10s %10s %10s %10s' % ('executor', 'events', 'p50 ms', 'p99 ms', 'max ms'))
+
+    for name, executor in [
+        ('inline', None),
+        ('greenlet', GreenletExecutor()),
+        ('thread', ThreadExecutor()),
+        ('process', ProcessExecutor())
+    ]:
+        latencies = run(executor, duration)
+
+        print('%-10s %10d %10.3f %10.3f %10.3f' % (
+            name, len(latencies),
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            max(latencies or [0]) * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION)
@@ -0,0 +1,257 @@
+"""In-process load test.
+
+Drives an `Engine` with fake engine.io connections through connect
+storms, room joins, inbound events, unicast emits, broadcasts and ack
+round-trips, reporting ops/sec, p50/p99 latency and memory per
+connection.
+
+    python -m benchmarks.load [--clients N] [--rooms N] [--json PATH]
+                              [--compare PATH] [--tolerance 0.2]
+
+`--json -` writes the results to stdout as JSON. `--compare` exits with
+status 1 when a scenario's ops/sec dropped by more than `--tolerance`
+against previously written results.
+"""
+from benchmarks.common import FakeConnection, memory_usage, percentile
+from pysocketio import Engine
+from pysocketio.metrics import clock
+
+import argparse
+import json
+import platform
+import re
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ACK_REQUEST = re.compile(r'^2(/[^,]*,)?(\d+)')
+
+PAYLOAD = {'username': 'bench', 'message': 'hello world', 'timestamp': 1500000000}
+
+
+class EchoConnection(FakeConnection):
+    """Fake connection answering each event requesting an ack."""
+
+    def write(self, data):
+        self.written += 1
+
+        if not isinstance(data, str):
+            return
+
+        match = ACK_REQUEST.match(data)
+
+        if match:
+            self.emit('data', '3%s%s["pong"]' % (match.group(1) or '', match.group(2)))
+
+
+def measure(name, operations):
+    """Runs each operation, timing them individually.
+
+    :param operations: Iterable of functions
+    :type operations: iterable
+    """
+    latencies = []
+
+    started = clock()
+
+    for operation in operations:
+        before = clock()
+        operation()
+        latencies.append(clock() - before)
+
+    elapsed = clock() - started
+
+    return result(name, latencies, elapsed)
+
+
+def result(name, latencies, elapsed):
+    return {
+        'name': name,
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0,
+        'p50_us': percentile(latencies, 0.5) * 1000000,
+        'p99_us': percentile(latencies, 0.99) * 1000000
+    }
+
+
+def scenario_connect(engine, count):
+    connections = []
+
+    def connect(x):
+        def operation():
+            conn = EchoConnection('c%d' % x)
+            engine.on_connection(conn)
+
+            connections.append(conn)
+
+        return operation
+
+    baseline = memory_usage()
+    stats = measure('connect', [connect(x) for x in range(count)])
+
+    stats['bytes_per_connection'] = (memory_usage() - baseline) // max(count, 1)
+
+    return stats, connections
+
+
+def scenario_join(sockets, rooms):
+    return measure('join', [
+        (lambda socket, room: lambda: socket.join(room))(socket, 'room-%d' % (x % rooms))
+        for x, socket in enumerate(sockets)
+    ])
+
+
+def scenario_inbound(engine, connections):
+    received = []
+    engine.route('bench', lambda socket, data: received.append(data))
+
+    stats = measure('inbound', [
+        (lambda conn: lambda: conn.emit('data', '2["bench",1]'))(conn)
+        for conn in connections
+    ])
+
+    assert len(received) == len(connections)
+    return stats
+
+
+def scenario_unicast(sockets):
+    return measure('unicast', [
+        (lambda socket: lambda: socket.emit('message', PAYLOAD))(socket)
+        for socket in sockets
+    ])
+
+
+def scenario_broadcast(engine, rooms):
+    stats = measure('broadcast', [
+        (lambda room: lambda: engine.to(room).emit('message', PAYLOAD))('room-%d' % x)
+        for x in range(rooms)
+    ])
+
+    stats['recipients_per_op'] = len(engine.of('/').connected) // max(rooms, 1)
+    return stats
+
+
+def scenario_ack(sockets):
+    latencies = []
+
+    def send(socket):
+        def operation():
+            sent = clock()
+            socket.emit('ping', lambda *args: latencies.append(clock() - sent))
+
+        return operation
+
+    started = clock()
+
+    for socket in sockets:
+        send(socket)()
+
+    stats = result('ack', latencies, clock() - started)
+
+    assert stats['ops'] == len(sockets)
+    return stats
+
+
+def run(clients, rooms):
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    engine = Engine()
+    results = []
+
+    stats, connections = scenario_connect(engine, clients)
+    results.append(stats)
+
+    if tracemalloc is not None:
+        tracemalloc.stop()
+
+    nsp = engine.of('/')
+    sockets = [nsp.connected[conn.sid] for conn in connections]
+
+    results.append(scenario_join(sockets, rooms))
+    results.append(scenario_inbound(engine, connections))
+    results.append(scenario_unicast(sockets))
+    results.append(scenario_broadcast(engine, rooms))
+    results.append(scenario_ack(sockets))
+
+    return {
+        'clients': clients,
+        'rooms': rooms,
+        'python': platform.python_version(),
+        'results': results
+    }
+
+
+def report(summary):
+    print('clients: %d, rooms: %d' % (summary['clients'], summary['rooms']))
+    print('%-10s %10s %14s %12s %12s' % ('scenario', 'ops', 'ops/sec', 'p50 us', 'p99 us'))
+
+    for stats in summary['results']:
+        print('%-10s %10d %14.0f %12.1f %12.1f' % (
+            stats['name'], stats['ops'], stats['ops_per_sec'],
+            stats['p50_us'], stats['p99_us']
+        ))
+
+    for stats in summary['results']:
+        if 'bytes_per_connection' in stats:
+            print('bytes/connection: %d' % stats['bytes_per_connection'])
+
+
+def compare(summary, path, tolerance):
+    """Lists the scenarios slower than the results in `path`."""
+    with open(path) as fp:
+        baseline = dict([(stats['name'], stats) for stats in json.load(fp)['results']])
+
+    regressions = []
+
+    for stats in summary['results']:
+        previous = baseline.get(stats['name'])
+
+        if not previous or not previous['ops_per_sec']:
+            continue
+
+        change = stats['ops_per_sec'] / previous['ops_per_sec'] - 1
+
+        if change < -tolerance:
+            regressions.append((stats['name'], change))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='In-process load test')
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--json', help='Write results as JSON to PATH (- for stdout)')
+    parser.add_argument('--compare', help='Compare ops/sec with the JSON results in PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+    summary = run(args.clients, args.rooms)
+
+    if args.json == '-':
+        json.dump(summary, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(summary)
+
+    if args.json and args.json != '-':
+        with open(args.json, 'w') as fp:
+            json.dump(summary, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        regressions = compare(summary, args.compare, args.tolerance)
+
+        for name, change in regressions:
+            sys.stderr.write('regression: %s ops/sec %.1f%%\n' % (name, change * 100))
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Idle connection memory benchmark.
+
+Reports bytes per connection for freshly connected (idle) clients, and
+once every connection has used the state which is allocated on first
+use (decoder, ack table, emit flags, room targets). Figures include
+the fake engine.io connections.
+
+The `Client` and `Socket` state is then compared with a baseline: the
+pre-`__slots__` classes, which allocated their encoder, decoder, ack
+table, flags and room lists eagerly. Each socket has an event listener,
+as registered by applications (kept in the instance `__dict__` by
+`pyemitter.Emitter`, in a slot by `SlottedEmitter`).
+
+    python -m benchmarks.memory [connections]
+"""
+from benchmarks.common import connect, memory_usage, FakeConnection
+from pysocketio import Engine
+from pysocketio.client import Client
+from pysocketio.socket import Socket
+import pysocketio_parser as parser
+
+from pyemitter import Emitter
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+DEFAULT_COUNT = 100000
+
+
+def warm(engine, connections):
+    nsp = engine.of('/')
+
+    for conn in connections:
+        socket = nsp.connected[conn.sid]
+
+        socket.client.decoder
+
+        socket.acks = {}
+        socket.flags = {}
+        socket._rooms = set()
+
+
+class LegacyClient(object):
+    """`Client` state before the slimming (baseline)."""
+
+    def __init__(self, engine, conn):
+        self.engine = engine
+        self.conn = conn
+
+        self.encoder = parser.Encoder()
+        self.decoder = parser.Decoder()
+
+        self.sid = conn.sid
+        self.request = conn.request
+
+        self.conn.on('data', self.on_data)\
+                 .on('close', self.on_close)
+
+        self.decoder.on('decoded', self.on_decoded)
+
+        self.sockets = []
+        self.nsps = {}
+        self.connect_buffer = []
+
+    def on_data(self, data):
+        pass
+
+    def on_close(self, reason, description=None):
+        pass
+
+    def on_decoded(self, packet):
+        pass
+
+
+class LegacySocket(Emitter):
+    """`Socket` state before the slimming (baseline)."""
+
+    def __init__(self, nsp, client):
+        self.nsp = nsp
+        self.client = client
+        self.request = self.client.request
+        self.adapter = nsp.adapter
+
+        self.sid = client.sid
+
+        self.rooms = []
+        self.acks = {}
+
+        self.connected = True
+        self.disconnected = False
+
+        self._rooms = []
+        self.flags = {}
+
+
+def state_size(engine, count, client_class, socket_class):
+    """Measures the bytes per `client_class` and `socket_class` pair,
+       with a listener on each socket."""
+    nsp = engine.of('/')
+    handler = lambda *args: None
+    connections = [FakeConnection('s%d' % x) for x in range(count)]
+
+    baseline = memory_usage()
+
+    pairs = []
+
+    for conn in connections:
+        client = client_class(engine, conn)
+        socket = socket_class(nsp, client)
+
+        socket.on('message', handler)
+        pairs.append((client, socket))
+
+    size = (memory_usage() - baseline) // count
+
+    del pairs
+    return size
+
+
+def main(count):
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    engine = Engine()
+
+    baseline = memory_usage()
+    connections = connect(engine, count)
+    idle = memory_usage()
+
+    warm(engine, connections)
+    warmed = memory_usage()
+
+    print('connections:           %d' % count)
+    print('bytes/connection idle: %d' % ((idle - baseline) // count))
+    print('bytes/connection used: %d' % ((warmed - baseline) // count))
+
+    legacy = state_size(engine, count, LegacyClient, LegacySocket)
+    current = state_size(engine, count, Client, Socket)
+
+    print('')
+    print('client+socket state:')
+    print('  baseline (__dict__):  %d bytes' % legacy)
+    print('  current (__slots__):  %d bytes' % current)
+    print('  saved:                %d bytes (%.0f%%)' % (
+        legacy - current, (legacy - current) * 100.0 / legacy if legacy else 0
+    ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT)
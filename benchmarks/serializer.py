@@ -0,0 +1,91 @@
+"""Serializer microbenchmarks.
+
+Reports encode and decode throughput of each available serializer on
+representative packets.
+
+    python -m benchmarks.serializer [iterations]
+"""
+from benchmarks.common import Timer
+from pysocketio.serializer import FastJSONSerializer, JSONSerializer, MsgpackSerializer
+import pysocketio_parser as parser
+
+import json
+import sys
+
+DEFAULT_ITERATIONS = 20000
+
+PAYLOADS = [
+    ('ping', {'type': parser.EVENT, 'nsp': '/', 'data': ['ping']}),
+    ('chat', {'type': parser.EVENT, 'nsp': '/chat', 'id': 12, 'data': ['message', {
+        'username': 'user42',
+        'room': 'general',
+        'message': 'hello world, this is a chat message of typical length',
+        'timestamp': 1500000000
+    }]}),
+    ('state', {'type': parser.EVENT, 'nsp': '/', 'data': ['state', {
+        'players': [
+            {'id': x, 'name': 'player%d' % x, 'x': x * 1.5, 'y': x * 2.25, 'alive': x % 3 != 0}
+            for x in range(100)
+        ]
+    }]}),
+    ('binary', {'type': parser.BINARY_EVENT, 'nsp': '/', 'data': ['upload', {
+        'name': 'image.png',
+        'content': bytearray(64 * 1024)
+    }]})
+]
+
+
+def serializers():
+    yield 'json (parser)', JSONSerializer()
+    yield 'json (stdlib)', JSONSerializer(
+        lambda obj: json.dumps(obj, separators=(',', ':')), json.loads
+    )
+
+    fast = FastJSONSerializer()
+
+    if fast.name != 'json':
+        yield fast.name, fast
+
+    try:
+        yield 'msgpack', MsgpackSerializer()
+    except ImportError:
+        pass
+
+
+def run(serializer, packet, iterations):
+    encoder = serializer.encoder()
+    decoder = serializer.decoder()
+
+    frames = []
+    decoded = []
+
+    decoder.on('decoded', decoded.append)
+
+    with Timer() as encoding:
+        for x in range(iterations):
+            encoder.encode(packet, frames.append)
+
+    with Timer() as decoding:
+        for x in range(iterations):
+            for frame in frames[x]:
+                decoder.add(frame)
+
+    assert len(decoded) == iterations
+
+    size = sum([len(frame) for frame in frames[0]])
+
+    return size, iterations / encoding.elapsed, iterations / decoding.elapsed
+
+
+def main(iterations):
+    print('%-8s %-14s %10s %14s %14s' % ('payload', 'serializer', 'bytes', 'encode/s', 'decode/s'))
+
+    for payload, packet in PAYLOADS:
+        for name, serializer in serializers():
+            size, encode_rate, decode_rate = run(serializer, packet, iterations)
+
+            print('%-8s %-14s %10d %14.0f %14.0f' % (payload, name, size, encode_rate, decode_rate))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS)
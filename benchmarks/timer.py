@@ -0,0 +1,121 @@
+"""Timer benchmark.
+
+Schedules one deadline per connection (like an ack timeout), cancels
+90% of them (answered acks) and lets the rest fire over a second,
+with a greenlet per timer (`gevent.spawn_later`) and with the engine
+timer wheel. Reports the schedule/cancel time, memory per timer, the
+watchers active on the hub, and the lag of a probe greenlet sleeping
+1ms while timers fire (hub load).
+
+    python -m benchmarks.timer [connections ...]
+"""
+from benchmarks.common import memory_usage, percentile
+from pysocketio.metrics import clock
+from pysocketio.timer import TimerWheel
+
+import gevent
+import random
+import sys
+
+DEFAULT_CONNECTIONS = [10000, 100000]
+
+DELAY = 1.0
+SPREAD = 1.0
+
+CANCELLED = 0.9
+
+PROBE_INTERVAL = 0.001
+
+
+class Greenlets(object):
+    name = 'greenlets'
+
+    def schedule(self, delay, callback):
+        return gevent.spawn_later(delay, callback)
+
+    def cancel(self, timer):
+        timer.kill(block=False)
+
+
+class Wheel(object):
+    name = 'wheel'
+
+    def __init__(self):
+        self.wheel = TimerWheel()
+
+    def schedule(self, delay, callback):
+        return self.wheel.schedule(delay, callback)
+
+    def cancel(self, timer):
+        timer.cancel()
+
+
+def active_watchers():
+    return getattr(gevent.get_hub().loop, 'activecnt', None)
+
+
+def run(scheduler, count):
+    fired = []
+    callback = lambda: fired.append(True)
+
+    delays = [DELAY + random.random() * SPREAD for x in range(count)]
+
+    baseline = memory_usage()
+    started = clock()
+
+    timers = [scheduler.schedule(delay, callback) for delay in delays]
+
+    scheduled = clock() - started
+    size = (memory_usage() - baseline) // max(count, 1)
+
+    watchers = active_watchers()
+
+    started = clock()
+
+    for timer in timers[:int(count * CANCELLED)]:
+        scheduler.cancel(timer)
+
+    cancelled = clock() - started
+
+    del timers
+
+    # Probe the hub while the remaining timers fire
+    lags = []
+    end = clock() + DELAY + SPREAD + 0.5
+
+    while clock() < end:
+        before = clock()
+        gevent.sleep(PROBE_INTERVAL)
+        lags.append(clock() - before - PROBE_INTERVAL)
+
+    return {
+        'schedule_us': scheduled / count * 1000000,
+        'cancel_us': cancelled / max(int(count * CANCELLED), 1) * 1000000,
+        'bytes': size,
+        'watchers': watchers,
+        'fired': len(fired),
+        'lag_p99_ms': percentile(lags, 0.99) * 1000,
+        'lag_max_ms': max(lags or [0]) * 1000
+    }
+
+
+def main(connections):
+    print('%-10s %8s %12s %10s %8s %10s %8s %11s %11s' % (
+        'timers', 'count', 'schedule us', 'cancel us', 'bytes',
+        'watchers', 'fired', 'lag p99 ms', 'lag max ms'
+    ))
+
+    for count in connections:
+        for scheduler in [Greenlets(), Wheel()]:
+            stats = run(scheduler, count)
+
+            print('%-10s %8d %12.2f %10.2f %8d %10s %8d %11.3f %11.3f' % (
+                scheduler.name, count,
+                stats['schedule_us'], stats['cancel_us'], stats['bytes'],
+                stats['watchers'] if stats['watchers'] is not None else '-',
+                stats['fired'], stats['lag_p99_ms'], stats['lag_max_ms']
+            ))
+
+
+if __name__ == '__main__':
+    main([int(value) for value in sys.argv[1:]] or DEFAULT_CONNECTIONS)
@@ -29,48 +29,49 @@ users = {}
 def on_connection(socket):
     print 'on_connection', socket
 
-    logged_on = False
 
-    @socket.on('message')
-    def on_message(message):
-        socket.broadcast.emit('message', {
-            'username': socket.username,
-            'message': message
-        })
+@io.route('message')
+def on_message(socket, message):
+    socket.broadcast.emit('message', {
+        'username': socket.username,
+        'message': message
+    })
 
-    @socket.on('login')
-    def on_login(username):
-        print 'login "%s"' % username
 
-        # Store username on socket
-        socket.username = username
+@io.route('login')
+def on_login(socket, username):
+    print 'login "%s"' % username
 
-        # Update active user list
-        users[username] = True
+    # Store username on socket
+    socket.username = username
 
-        socket.emit('login', {
-            'active': len(users)
-        })
+    # Update active user list
+    users[username] = True
 
-        socket.broadcast.emit('user.joined', {
-            'username': username,
-            'active': len(users)
-        })
+    socket.emit('login', {
+        'active': len(users)
+    })
 
-    @socket.on('disconnect')
-    def on_disconnect():
-        if not hasattr(socket, 'username'):
-            return
+    socket.broadcast.emit('user.joined', {
+        'username': username,
+        'active': len(users)
+    })
 
-        if socket.username not in users:
-            return
 
-        del users[socket.username]
+@io.route('disconnect')
+def on_disconnect(socket, reason):
+    if not hasattr(socket, 'username'):
+        return
 
-        socket.broadcast.emit('user.left', {
-            'username': socket.username,
-            'active': len(users)
-        })
+    if socket.username not in users:
+        return
+
+    del users[socket.username]
+
+    socket.broadcast.emit('user.left', {
+        'username': socket.username,
+        'active': len(users)
+    })
 
 
 
@@ -1,4 +1,5 @@
 from pysocketio.engine import Engine
+from pysocketio.prefork import PreforkServer
 from pysocketio.server import Server
 
-__all__ = ['Engine', 'Server']
+__all__ = ['Engine', 'PreforkServer', 'Server']
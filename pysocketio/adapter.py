@@ -0,0 +1,302 @@
+from pysocketio.history import RoomHistory
+from pysocketio.metrics import clock
+from pysocketio import trace
+
+from pyemitter import Emitter
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def as_tuple(value):
+    """Converts lists (nested ones included) to tuples."""
+    if isinstance(value, (list, tuple)):
+        return tuple([as_tuple(item) for item in value])
+
+    return value
+
+
+class Adapter(Emitter):
+    def __init__(self, nsp):
+        """In-process room adapter, encodes each broadcast packet once
+           and fans the encoded frames out to every recipient.
+
+        :param nsp: Namespace
+        :type nsp: pysocketio.namespace.Namespace
+        """
+        self.nsp = nsp
+
+        self.rooms = {}
+        self.sids = {}
+
+        # Room histories (`pysocketio.history.RoomHistory`), by room name
+        self.histories = {}
+
+        self.encoder = nsp.engine.encoder
+
+    def close(self):
+        """Releases the adapter of a removed namespace."""
+        pass
+
+    def add(self, sid, room, callback=None):
+        """Adds a socket to a room.
+
+        :param sid: Socket id
+        :type sid: str
+
+        :param room: Room name
+        :type room: str
+
+        :param callback: Callback function
+        :type callback: function
+        """
+        self.sids.setdefault(sid, set()).add(room)
+        self.rooms.setdefault(room, set()).add(sid)
+
+        if callback:
+            callback()
+
+    def remove(self, sid, room, callback=None):
+        """Removes a socket from a room.
+
+        :param sid: Socket id
+        :type sid: str
+
+        :param room: Room name
+        :type room: str
+
+        :param callback: Callback function
+        :type callback: function
+        """
+        rooms = self.sids.get(sid)
+
+        if rooms is not None:
+            rooms.discard(room)
+
+        self._discard(room, sid)
+
+        if callback:
+            callback()
+
+    def remove_all(self, sid):
+        """Removes a socket from all rooms it's joined.
+
+        :param sid: Socket id
+        :type sid: str
+        """
+        for room in self.sids.pop(sid, None) or ():
+            self._discard(room, sid)
+
+    def _discard(self, room, sid):
+        sids = self.rooms.get(room)
+
+        if sids is None:
+            return
+
+        sids.discard(sid)
+
+        if not sids:
+            del self.rooms[room]
+
+    def keep_history(self, room, size):
+        """Keeps the last `size` packets broadcast to a room, `0` stops
+           keeping its history.
+
+        :param room: Room name
+        :type room: str
+
+        :param size: Number of packets kept
+        :type size: int
+        """
+        if not size:
+            self.histories.pop(room, None)
+            return
+
+        history = self.histories.get(room)
+
+        if history is not None and history.entries.maxlen == size:
+            return
+
+        replacement = RoomHistory(size)
+
+        if history is not None:
+            # Resize, keeping offsets and the most recent packets
+            replacement.entries.extend(history.entries)
+            replacement.offset = history.offset
+
+        self.histories[room] = replacement
+
+    def history(self, room, since=-1):
+        """Retrieves the encoded packets broadcast to a room after `since`.
+
+        :param room: Room name
+        :type room: str
+
+        :param since: Offset of the last packet received (-1 for all)
+        :type since: int
+
+        :rtype: list
+        """
+        history = self.histories.get(room)
+
+        if history is None:
+            return []
+
+        return history.since(since)
+
+    def clients(self, rooms=None, callback=None):
+        """Retrieves the socket ids in `rooms` (all sockets if empty).
+
+        :param rooms: Room names
+        :type rooms: list
+
+        :param callback: Callback function, called with the socket ids
+        :type callback: function
+        """
+        sids = self.targets(rooms)
+
+        if callback:
+            callback(sids)
+
+        return sids
+
+    def socket_rooms(self, sid, callback=None):
+        """Retrieves the rooms a socket has joined.
+
+        :param sid: Socket id
+        :type sid: str
+
+        :param callback: Callback function, called with the room names
+        :type callback: function
+        """
+        rooms = set(self.sids.get(sid) or ())
+
+        if callback:
+            callback(rooms)
+
+        return rooms
+
+    def broadcast(self, packet, options):
+        """Broadcasts a packet.
+
+        The packet is encoded a single time, the encoded frames are then
+        written to each recipient through `Socket.packet(encoded=True)`.
+
+        :param packet: Packet
+        :type packet: dict
+
+        :param options: Broadcast options (`rooms`, `except`, `flags`)
+        :type options: dict
+        """
+        packet['nsp'] = self.nsp.name
+
+        metrics = self.nsp.engine.metrics
+        started = clock() if metrics is not None else None
+
+        sampled = packet.get('trace')
+
+        def on_encoded(encoded_packets):
+            if metrics is not None:
+                metrics.observe('encode_seconds', clock() - started)
+
+            if sampled is not None:
+                sampled.mark('encoded')
+
+            count = self.deliver(encoded_packets, options)
+
+            if sampled is not None:
+                sampled.finish('delivered', count)
+
+        self.encoder.encode(packet, on_encoded)
+
+    def deliver(self, encoded_packets, options):
+        """Writes encoded packets to the local sockets targeted by `options`.
+
+        :param encoded_packets: Encoded packets
+        :type encoded_packets: list
+
+        :param options: Broadcast options (`rooms`, `except`, `flags`)
+        :type options: dict
+
+        :return: Number of recipients
+        :rtype: int
+        """
+        flags = options.get('flags') or {}
+        volatile = flags.get('volatile')
+        conflate = flags.get('conflate')
+
+        if conflate is not None:
+            # Keys are lists once relayed between nodes
+            conflate = as_tuple(conflate)
+
+        histories = self.histories
+        rooms = options.get('rooms')
+
+        if histories and rooms and not volatile:
+            for room in rooms:
+                history = histories.get(room)
+
+                if history is not None:
+                    history.append(encoded_packets)
+
+        if trace.adapter:
+            log.debug('delivering %s to rooms %s', encoded_packets, rooms)
+
+        count = 0
+
+        for socket in self.recipients(rooms, options.get('except')):
+            socket.packet(encoded_packets, True, volatile, conflate)
+            count += 1
+
+        metrics = self.nsp.engine.metrics
+
+        if metrics is not None:
+            metrics.observe('broadcast_fanout', count, (self.nsp.name,))
+
+        return count
+
+    def targets(self, rooms=None, excluded=None):
+        """Resolves the socket ids targeted by a broadcast, as the union
+           of `rooms` minus the `excluded` socket ids.
+
+        :param rooms: Room names (all sockets if empty)
+        :type rooms: iterable
+
+        :param excluded: Socket ids to skip
+        :type excluded: iterable
+        """
+        if rooms:
+            index = self.rooms
+            sids = set().union(*[index[room] for room in rooms if room in index])
+        else:
+            sids = set(self.sids)
+
+        if excluded:
+            sids.difference_update(excluded)
+
+        return sids
+
+    def recipients(self, rooms=None, excluded=None):
+        """Resolves the connected sockets (and recoverable sessions)
+           targeted by a broadcast.
+
+        :param rooms: Room names (all sockets if empty)
+        :type rooms: iterable
+
+        :param excluded: Socket ids to skip
+        :type excluded: iterable
+        """
+        connected = self.nsp.connected
+        ghosts = self.nsp.ghosts
+
+        for sid in self.targets(rooms, excluded):
+            socket = connected.get(sid)
+
+            if socket:
+                yield socket
+            elif ghosts:
+                # Disconnected session buffering missed packets
+                session = ghosts.get(sid)
+
+                if session is not None:
+                    yield session
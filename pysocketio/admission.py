@@ -0,0 +1,252 @@
+"""Connection admission control.
+
+Enabled with the engine `admission` option:
+
+    Engine({'admission': {
+        'rate': 500,            # new connections per second (global)
+        'ip_rate': 5,           # new connections per second (per address)
+        'max_connections': 20000,
+        'max_namespaces': 8,    # namespaces per client
+        'event_rate': 50        # inbound events per second (per socket)
+    }})
+
+Rates are token buckets, bursts default to one second worth of tokens.
+Rejected connections and namespaces are sent an ERROR packet, encoded
+once per namespace and reason, rate limited events are dropped.
+"""
+from pysocketio.metrics import clock
+import pysocketio_parser as parser
+
+from collections import OrderedDict
+import logging
+
+log = logging.getLogger(__name__)
+
+RATE_LIMITED = 'rate limited'
+TOO_MANY_CONNECTIONS = 'too many connections'
+TOO_MANY_NAMESPACES = 'too many namespaces'
+
+EVENT_TYPES = (parser.EVENT, parser.BINARY_EVENT)
+
+
+def remote_address(request):
+    """Retrieves the client address of a request."""
+    address = getattr(request, 'remote_addr', None)
+
+    if address is not None:
+        return address
+
+    environ = getattr(request, 'environ', None) or {}
+    return environ.get('REMOTE_ADDR')
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst=None):
+        """Token bucket, refilled with `rate` tokens per second.
+
+        :param rate: Tokens per second
+        :type rate: float
+
+        :param burst: Bucket capacity (defaults to `rate`)
+        :type burst: float
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def consume(self, now=None):
+        """Takes a token, returns `False` if the bucket is empty."""
+        if now is None:
+            now = clock()
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController(object):
+    def __init__(self, engine, rate=None, burst=None, ip_rate=None, ip_burst=None,
+                 max_connections=None, max_namespaces=None, event_rate=None,
+                 event_burst=None, address=remote_address, max_addresses=65536):
+        """Limits connections, namespaces and inbound events.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param rate: New connections per second
+        :type rate: float
+
+        :param ip_rate: New connections per second, per client address
+        :type ip_rate: float
+
+        :param max_connections: Maximum concurrent connections
+        :type max_connections: int
+
+        :param max_namespaces: Maximum namespaces per client
+        :type max_namespaces: int
+
+        :param event_rate: Inbound events per second, per socket
+        :type event_rate: float
+
+        :param address: Client address function, called with the request
+                        (override when behind a proxy)
+        :type address: function
+
+        :param max_addresses: Per-address buckets kept, least recently used
+                              buckets are discarded first
+        :type max_addresses: int
+        """
+        self.engine = engine
+
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.ip_buckets = OrderedDict()
+
+        self.address = address
+        self.max_addresses = max_addresses
+
+        self.max_connections = max_connections
+        self.max_namespaces = max_namespaces
+
+        self.event_rate = event_rate
+        self.event_burst = event_burst
+
+        self.clients = set()
+
+        # (nsp, reason) -> encoded ERROR packet
+        self.errors = {}
+
+    def admit(self, conn):
+        """Checks if a new connection can be accepted.
+
+        :param conn: EIO Socket
+        :type conn: pyengineio.socket.Socket
+
+        :return: Rejection reason, `None` if accepted
+        :rtype: str
+        """
+        if self.max_connections and len(self.clients) >= self.max_connections:
+            return TOO_MANY_CONNECTIONS
+
+        now = clock()
+
+        if self.bucket is not None and not self.bucket.consume(now):
+            return RATE_LIMITED
+
+        if self.ip_rate and not self.ip_bucket(conn.request).consume(now):
+            return RATE_LIMITED
+
+        self.clients.add(conn.sid)
+        return None
+
+    def ip_bucket(self, request):
+        key = self.address(request)
+        bucket = self.ip_buckets.pop(key, None)
+
+        if bucket is None:
+            bucket = TokenBucket(self.ip_rate, self.ip_burst)
+
+            while len(self.ip_buckets) >= self.max_addresses:
+                self.ip_buckets.popitem(last=False)
+
+        # Most recently used last
+        self.ip_buckets[key] = bucket
+        return bucket
+
+    def release(self, client):
+        """Called when an admitted client closes."""
+        self.clients.discard(client.sid)
+
+    def admit_namespace(self, client):
+        """Checks if `client` can connect to another namespace."""
+        if not self.max_namespaces:
+            return True
+
+        pending = len(client.connect_buffer) if client.connect_buffer else 0
+        return len(client.nsps) + pending < self.max_namespaces
+
+    def admit_event(self, socket):
+        """Checks if `socket` is within its inbound event rate."""
+        if socket.bucket is None:
+            socket.bucket = TokenBucket(self.event_rate, self.event_burst)
+
+        return socket.bucket.consume()
+
+    def reject(self, conn, reason, nsp='/'):
+        """Sends an ERROR packet, then closes the connection.
+
+        :param conn: EIO Socket
+        :type conn: pyengineio.socket.Socket
+
+        :param reason: Rejection reason
+        :type reason: str
+
+        :param nsp: Namespace name
+        :type nsp: str
+        """
+        log.debug('rejecting %s (%s): %s', conn.sid, nsp, reason)
+        self.rejected(reason)
+
+        encoded = self.engine.transcode(self.error(reason, nsp), self.engine.negotiate(conn.request))
+
+        for ep in encoded:
+            conn.write(ep)
+
+        conn.close()
+
+    def reject_namespace(self, client, reason, nsp):
+        """Sends an ERROR packet for `nsp`, the connection is kept open.
+
+        :param client: Client
+        :type client: pysocketio.client.Client
+
+        :param reason: Rejection reason
+        :type reason: str
+
+        :param nsp: Namespace name
+        :type nsp: str
+        """
+        log.debug('rejecting %s (%s): %s', client.sid, nsp, reason)
+        self.rejected(reason)
+
+        # Through the client, ordered with its buffered packets
+        client.packet(self.error(reason, nsp), encoded=True)
+
+    def rejected(self, reason):
+        metrics = self.engine.metrics
+
+        if metrics is not None:
+            metrics.inc('admission_rejected', (reason,))
+
+    def error(self, reason, nsp='/'):
+        """Retrieves the encoded ERROR packet for `reason`."""
+        key = (nsp, reason)
+        encoded = self.errors.get(key)
+
+        if encoded is not None:
+            return encoded
+
+        result = []
+
+        self.engine.encoder.encode({
+            'type': parser.ERROR,
+            'nsp': nsp,
+            'data': reason
+        }, result.extend)
+
+        # Namespace names are client supplied
+        if len(self.errors) < 256:
+            self.errors[key] = result
+
+        return result
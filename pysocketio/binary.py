@@ -0,0 +1,408 @@
+"""Binary packet support.
+
+Attachments are detached from (and re-attached to) packets by reference,
+buffers are handed to the transport, and to event handlers, as the same
+`bytes`/`bytearray`/`memoryview` objects without copies.
+"""
+import pysocketio_parser as parser
+
+from pyemitter import Emitter
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+BINARY_TYPES = (bytearray, memoryview)
+
+if bytes is not str:
+    BINARY_TYPES += (bytes,)
+
+PACKET_TYPES = (parser.BINARY_EVENT, parser.BINARY_ACK)
+
+#: Characters scanned for the header of oversized packets
+HEADER_LIMIT = 1024
+
+
+def is_binary(obj):
+    return isinstance(obj, BINARY_TYPES)
+
+
+def has_binary(obj):
+    """Checks if `obj` contains binary data.
+
+    :param obj: Packet data
+    :type obj: object
+    """
+    if isinstance(obj, BINARY_TYPES):
+        return True
+
+    if isinstance(obj, (list, tuple)):
+        for value in obj:
+            if has_binary(value):
+                return True
+
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            if has_binary(value):
+                return True
+
+    return False
+
+
+def deconstruct_packet(packet):
+    """Replaces the buffers in a packet with placeholders.
+
+    :param packet: Packet
+    :type packet: dict
+
+    :return: Packet with placeholders (`attachments` set) and the detached buffers
+    :rtype: (dict, list)
+    """
+    buffers = []
+
+    def deconstruct(data):
+        if isinstance(data, BINARY_TYPES):
+            buffers.append(data)
+            return {'_placeholder': True, 'num': len(buffers) - 1}
+
+        if isinstance(data, (list, tuple)):
+            return [deconstruct(value) for value in data]
+
+        if isinstance(data, dict):
+            return dict([(key, deconstruct(value)) for key, value in data.items()])
+
+        return data
+
+    result = dict(packet)
+    result['data'] = deconstruct(packet.get('data'))
+    result['attachments'] = len(buffers)
+
+    return result, buffers
+
+
+def reconstruct_packet(packet, buffers):
+    """Replaces the placeholders in a packet with `buffers`.
+
+    :param packet: Packet with placeholders
+    :type packet: dict
+
+    :param buffers: Attachments
+    :type buffers: list
+    """
+    def reconstruct(data):
+        if isinstance(data, dict):
+            if data.get('_placeholder'):
+                num = data.get('num')
+
+                if not isinstance(num, int) or not 0 <= num < len(buffers):
+                    raise ValueError('Invalid attachment placeholder %r' % (num,))
+
+                return buffers[num]
+
+            for key, value in data.items():
+                data[key] = reconstruct(value)
+
+        elif isinstance(data, list):
+            for x, value in enumerate(data):
+                data[x] = reconstruct(value)
+
+        return data
+
+    packet['data'] = reconstruct(packet.get('data'))
+    packet.pop('attachments', None)
+
+    return packet
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def encode_string(packet, dumps=dumps):
+    """Encodes a packet as a string (socket.io protocol format).
+
+    :param packet: Packet
+    :type packet: dict
+
+    :param dumps: JSON encoder function
+    :type dumps: function
+    """
+    p_type = packet['type']
+    result = str(p_type)
+
+    if p_type in PACKET_TYPES:
+        result += '%d-' % packet['attachments']
+
+    nsp = packet.get('nsp')
+    separator = False
+
+    if nsp and nsp != '/':
+        result += nsp
+        separator = True
+
+    if packet.get('id') is not None:
+        if separator:
+            result += ','
+            separator = False
+
+        result += str(packet['id'])
+
+    if packet.get('data') is not None:
+        if separator:
+            result += ','
+
+        result += dumps(packet['data'])
+
+    return result
+
+
+def decode_header(data, limit=None):
+    """Decodes the type, attachment count and namespace of a string
+       encoded packet.
+
+    :param data: Encoded packet
+    :type data: str
+
+    :param limit: Maximum header length scanned
+    :type limit: int
+
+    :return: Packet (without `id` and `data`) and the header length
+    :rtype: (dict, int)
+    """
+    packet = {'type': int(data[0]), 'nsp': '/'}
+    x = 1
+
+    if limit is None:
+        limit = len(data)
+
+    if packet['type'] in PACKET_TYPES:
+        end = data.find('-', x, limit)
+
+        if end < 0:
+            raise ValueError('Invalid attachments header')
+
+        packet['attachments'] = int(data[x:end])
+        x = end + 1
+
+    if data[x:x + 1] == '/':
+        end = data.find(',', x, limit)
+
+        if end < 0:
+            if limit < len(data):
+                raise ValueError('Invalid namespace header')
+
+            end = len(data)
+
+        packet['nsp'] = data[x:end]
+        x = end + 1
+
+    return packet, x
+
+
+def decode_string(data, loads=json.loads):
+    """Decodes a string encoded packet.
+
+    :param data: Encoded packet
+    :type data: str
+
+    :param loads: JSON decoder function
+    :type loads: function
+    """
+    packet, x = decode_header(data)
+    end = x
+
+    while end < len(data) and data[end].isdigit():
+        end += 1
+
+    if end > x:
+        packet['id'] = int(data[x:end])
+
+    if end < len(data):
+        packet['data'] = loads(data[end:])
+
+    return packet
+
+
+class Encoder(object):
+    #: Header frames are text, attachments binary
+    binary = False
+
+    def __init__(self, dumps=None):
+        """Packet encoder, binary packets are encoded here (header and
+           attachments by reference), other packets by `pysocketio_parser`
+           unless a `dumps` function is provided.
+
+        :param dumps: JSON encoder function
+        :type dumps: function
+        """
+        self.dumps = dumps
+        self.parser = parser.Encoder() if dumps is None else None
+
+    def encode(self, packet, callback):
+        """Encodes a packet.
+
+        :param packet: Packet
+        :type packet: dict
+
+        :param callback: Callback function, called with the encoded packets
+        :type callback: function
+        """
+        if packet['type'] not in PACKET_TYPES:
+            if self.parser is not None:
+                return self.parser.encode(packet, callback)
+
+            return callback([encode_string(packet, self.dumps)])
+
+        packet, buffers = deconstruct_packet(packet)
+
+        callback([encode_string(packet, self.dumps or dumps)] + buffers)
+
+
+class Decoder(Emitter):
+    def __init__(self, loads=None, max_size=None, max_attachments=None):
+        """Packet decoder, collects the attachments of binary packets
+           into a list and re-attaches them by reference. Other packets
+           are decoded by `pysocketio_parser` unless a `loads` function
+           is provided.
+
+        Packets over the limits are rejected before being parsed (or
+        their attachments buffered), `rejected` is emitted with the
+        reason and namespace and their remaining attachments are skipped.
+
+        :param loads: JSON decoder function
+        :type loads: function
+
+        :param max_size: Maximum packet size, attachments included (bytes)
+        :type max_size: int
+
+        :param max_attachments: Maximum attachments per packet
+        :type max_attachments: int
+        """
+        self.loads = loads
+        self.parser = None
+
+        self.max_size = max_size
+        self.max_attachments = max_attachments
+
+        self.packet = None
+        self.buffers = None
+        self.size = 0
+
+        # Attachments left of a rejected packet
+        self.skipping = 0
+
+    @property
+    def pending(self):
+        """A packet is partially received."""
+        return self.packet is not None or self.skipping > 0
+
+    def add(self, data):
+        """Decodes a frame, emits `decoded` with each complete packet.
+
+        :param data: Frame
+        :type data: str or bytes
+        """
+        if self.skipping:
+            if is_binary(data):
+                self.skipping -= 1
+                return
+
+            # Text frame, the client stopped sending the rejected attachments
+            self.skipping = 0
+
+        if self.packet is not None:
+            return self.add_attachment(data)
+
+        if is_binary(data):
+            raise ValueError('Got binary data when not reconstructing a packet')
+
+        if self.max_size and len(data) > self.max_size:
+            packet = self.header(data)
+
+            if packet is not None:
+                self.reject(packet, 'packet too large')
+
+            return
+
+        if data[:1] not in ('5', '6'):
+            return self.decode(data)
+
+        if self.max_attachments is not None:
+            packet = self.header(data)
+
+            if packet is None:
+                return
+
+            if packet['attachments'] > self.max_attachments:
+                return self.reject(packet, 'too many attachments')
+
+        packet = decode_string(data, self.loads or json.loads)
+
+        if not packet.get('attachments'):
+            return self._emit_packet(reconstruct_packet(packet, []))
+
+        self.packet = packet
+        self.buffers = []
+        self.size = len(data)
+
+    def header(self, data):
+        """Decodes the header of a packet, malformed headers are rejected."""
+        try:
+            return decode_header(data, HEADER_LIMIT)[0]
+        except (ValueError, IndexError) as ex:
+            log.debug('invalid packet header: %s', ex)
+
+        self.emit('rejected', 'invalid packet', '/')
+        return None
+
+    def reject(self, packet, reason, received=0):
+        log.debug('rejecting packet: %s', reason)
+
+        self.skipping = max(packet.get('attachments', 0) - received, 0)
+        self.emit('rejected', reason, packet['nsp'])
+
+    def add_attachment(self, data):
+        if self.max_size:
+            self.size += len(data)
+
+            if self.size > self.max_size:
+                packet, received = self.packet, len(self.buffers) + 1
+
+                self.packet = None
+                self.buffers = None
+
+                return self.reject(packet, 'packet too large', received)
+
+        self.buffers.append(data)
+
+        if len(self.buffers) < self.packet['attachments']:
+            return
+
+        packet, buffers = self.packet, self.buffers
+
+        self.packet = None
+        self.buffers = None
+
+        self._emit_packet(reconstruct_packet(packet, buffers))
+
+    def decode(self, data):
+        if self.loads is not None:
+            return self._emit_packet(decode_string(data, self.loads))
+
+        if self.parser is None:
+            self.parser = parser.Decoder()
+            self.parser.on('decoded', self._emit_packet)
+
+        self.parser.add(data)
+
+    def _emit_packet(self, packet):
+        self.emit('decoded', packet)
+
+    def destroy(self):
+        if self.parser is not None:
+            self.parser.destroy()
+            self.parser = None
+
+        self.packet = None
+        self.buffers = None
+        self.skipping = 0
@@ -0,0 +1,410 @@
+from pysocketio.timer import Timeout
+from pysocketio import trace
+
+from collections import deque, OrderedDict
+import gevent
+import logging
+
+log = logging.getLogger(__name__)
+
+#: Drops the oldest queued packets
+DROP_OLDEST = 'drop-oldest'
+
+#: Drops queued volatile packets first, then the oldest packets
+DROP_VOLATILE = 'drop-volatile'
+
+#: Disconnects the slow consumer
+DISCONNECT = 'disconnect'
+
+POLICIES = [DROP_OLDEST, DROP_VOLATILE, DISCONNECT]
+
+
+def write_payload(conn, packets):
+    """Queues encoded packets on the engine.io socket and flushes them
+       with a single transport write (one payload on polling transports).
+
+    :param conn: EIO Socket
+    :type conn: pyengineio.socket.Socket
+
+    :param packets: Encoded packets
+    :type packets: list
+    """
+    write_buffer = getattr(conn, 'write_buffer', None)
+
+    if write_buffer is None:
+        for ep in packets:
+            conn.write(ep)
+
+        return
+
+    packets_fn = getattr(conn, 'packets_fn', None)
+
+    for ep in packets:
+        write_buffer.append({'type': 'message', 'data': ep})
+
+        if packets_fn is not None:
+            # One (empty) sent callback per packet
+            packets_fn.append(None)
+
+    conn.flush()
+
+
+class FlushQueue(object):
+    def __init__(self):
+        """Write buffers flushed at the end of the current loop turn,
+           shared by the clients of an engine so a broadcast schedules a
+           single greenlet."""
+        self.dirty = OrderedDict()
+        self.runner = None
+
+    def add(self, buffer):
+        self.dirty[buffer] = True
+
+        if self.runner is None:
+            self.runner = gevent.spawn(self.run)
+
+        return self
+
+    def discard(self, buffer):
+        self.dirty.pop(buffer, None)
+
+    def run(self):
+        dirty = self.dirty
+
+        self.dirty = OrderedDict()
+        self.runner = None
+
+        for buffer in dirty:
+            buffer.scheduled = None
+
+            try:
+                buffer.flush()
+            except Exception as ex:
+                log.warn('error flushing write buffer: %s', ex, exc_info=True)
+
+
+class WriteBuffer(object):
+    def __init__(self, client, window=None, size=None,
+                 high_watermark=None, low_watermark=None, limit=None,
+                 policy=DROP_OLDEST, max_keys=1000):
+        """Outbound packet queue for a `Client`.
+
+        Coalesces encoded packets, flushing them together at the end of
+        the current event-loop turn (or after `window` seconds), and
+        optionally bounds the bytes queued for a slow consumer.
+
+        Flushed packets are queued on the engine.io socket together and
+        sent with a single transport write, as one payload on polling
+        transports. Next loop turn flushes (`window` 0) are run by the
+        engine `FlushQueue`, from one greenlet for every client.
+
+        Conflated packets only keep the latest pending packet per key,
+        held until the transport is writable and flushed after other
+        queued packets. They count towards `limit` (dropped after the
+        other queued packets), at most `max_keys` keys are kept, the least
+        recently updated key is dropped beyond.
+
+        Events are emitted on each socket of the client:
+
+         - `backpressure` (queued bytes) once `high_watermark` is reached
+         - `drain` (queued bytes) once back under `low_watermark`
+         - `drop` (packet count) when the `limit` policy discards packets
+
+        :param client: Client
+        :type client: pysocketio.client.Client
+
+        :param window: Seconds to wait before flushing (0 = next loop turn,
+                       None = flush immediately)
+        :type window: float
+
+        :param size: Buffered bytes which trigger an immediate flush
+        :type size: int
+
+        :param high_watermark: Queued bytes which trigger `backpressure`
+        :type high_watermark: int
+
+        :param low_watermark: Queued bytes which trigger `drain`
+        :type low_watermark: int
+
+        :param limit: Maximum queued bytes, `policy` is applied beyond this
+        :type limit: int
+
+        :param policy: Overflow policy (`DROP_OLDEST`, `DROP_VOLATILE` or `DISCONNECT`)
+        :type policy: str
+
+        :param max_keys: Maximum pending conflation keys
+        :type max_keys: int
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown send queue policy %r' % policy)
+
+        self.client = client
+
+        self.window = window
+        self.size = size
+
+        if limit is None:
+            limit = high_watermark
+
+        if low_watermark is None and high_watermark:
+            low_watermark = high_watermark // 2
+
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.limit = limit
+        self.policy = policy
+        self.max_keys = max_keys
+
+        self.entries = deque()
+        self.length = 0
+
+        # key -> (encoded packets, size), created on first use
+        self.conflated = None
+
+        self.paused = False
+        self.scheduled = None
+        self.transport = None
+        self.attached = False
+
+    @property
+    def bounded(self):
+        return self.limit is not None
+
+    @property
+    def holding(self):
+        """Packets are held while the transport isn't writable."""
+        return self.bounded or self.conflated is not None
+
+    def attach(self):
+        """Listens for transport drains, queued packets are held
+           until the transport is writable again."""
+        if not self.holding or self.attached:
+            return
+
+        self.attached = True
+
+        self.client.conn.on('drain', self.on_drain)\
+                        .on('upgrade', self.on_upgrade)
+
+        self.on_upgrade(self.client.conn.transport)
+
+    def detach(self):
+        if not self.attached:
+            return
+
+        self.attached = False
+
+        self.client.conn.off('drain', self.on_drain)\
+                        .off('upgrade', self.on_upgrade)
+
+        if self.transport is not None:
+            self.transport.off('drain', self.on_drain)
+            self.transport = None
+
+    def on_upgrade(self, transport=None):
+        if self.transport is not None:
+            self.transport.off('drain', self.on_drain)
+
+        self.transport = transport or self.client.conn.transport
+        self.transport.on('drain', self.on_drain)
+
+    def on_drain(self, *args):
+        if self.entries or self.conflated:
+            self.flush()
+
+    def write(self, encoded_packets, volatile=False):
+        """Queues encoded packets, packets are flushed in write order.
+
+        :param encoded_packets: Encoded packets
+        :type encoded_packets: list
+
+        :param volatile: Flag indicating the packet is volatile
+        :type volatile: bool
+        """
+        size = 0
+
+        for ep in encoded_packets:
+            size += len(ep)
+
+        self.entries.append((encoded_packets, volatile, size))
+        self.length += size
+
+        self.queued()
+
+    def queued(self):
+        """Applies the watermarks and limit to the queued bytes, then
+           submits them."""
+        if self.high_watermark and not self.paused and self.length >= self.high_watermark:
+            self.paused = True
+            self.notify('backpressure', self.length)
+
+        if self.bounded and self.length > self.limit and not self.overflow():
+            return
+
+        self.submit()
+
+    def conflate(self, encoded_packets, key):
+        """Queues encoded packets, replacing the pending packets of `key`.
+
+        :param encoded_packets: Encoded packets
+        :type encoded_packets: list
+
+        :param key: Conflation key
+        :type key: hashable
+        """
+        if self.conflated is None:
+            self.conflated = OrderedDict()
+            self.attach()
+
+        previous = self.conflated.pop(key, None)
+
+        if previous is not None:
+            self.length -= previous[1]
+
+        size = 0
+
+        for ep in encoded_packets:
+            size += len(ep)
+
+        self.conflated[key] = (encoded_packets, size)
+        self.length += size
+
+        if self.max_keys and len(self.conflated) > self.max_keys:
+            # Least recently updated key
+            self.length -= self.conflated.popitem(last=False)[1][1]
+            self.notify('drop', 1)
+
+        self.queued()
+
+    def submit(self):
+        """Flushes now, or schedules a flush."""
+        if self.window is None or (self.size and self.length >= self.size):
+            return self.flush()
+
+        self.schedule()
+
+    def overflow(self):
+        """Applies the overflow policy, returns `False` if the
+           client has been disconnected."""
+        if self.policy == DISCONNECT:
+            log.debug('disconnecting slow consumer, %s bytes queued', self.length)
+
+            self.clear()
+            self.client.close('slow consumer')
+            return False
+
+        dropped = 0
+
+        if self.policy == DROP_VOLATILE:
+            entries = deque()
+
+            for entry in self.entries:
+                if entry[1] and self.length > self.limit:
+                    self.length -= entry[2]
+                    dropped += 1
+                    continue
+
+                entries.append(entry)
+
+            self.entries = entries
+
+        while self.entries and self.length > self.limit:
+            self.length -= self.entries.popleft()[2]
+            dropped += 1
+
+        while self.conflated and self.length > self.limit:
+            self.length -= self.conflated.popitem(last=False)[1][1]
+            dropped += 1
+
+        if trace.buffer:
+            log.debug('dropped %s queued packet(s)', dropped)
+
+        self.notify('drop', dropped)
+        return True
+
+    def schedule(self):
+        """Schedules a flush, if one isn't already pending."""
+        if self.scheduled is not None:
+            return
+
+        timer = self.client.engine.timer
+
+        if self.window and self.window >= timer.resolution:
+            # Shared engine timer, instead of a greenlet per client
+            self.scheduled = timer.schedule(self.window, self.flush)
+        elif self.window:
+            self.scheduled = gevent.spawn_later(self.window, self.flush)
+        else:
+            self.scheduled = self.client.engine.flushes.add(self)
+
+    def flush(self):
+        """Writes queued packets to the transport, in order, as a single
+           engine.io payload."""
+        self.cancel()
+
+        if not self.entries and not self.conflated:
+            return
+
+        conn = self.client.conn
+
+        if conn.ready_state != 'open':
+            if trace.buffer:
+                log.debug('discarding %s queued packet(s), transport not ready', len(self.entries))
+
+            return self.clear()
+
+        if self.holding and not conn.transport.writable:
+            # Hold packets until the transport drains
+            return
+
+        entries = self.entries
+        conflated = self.conflated
+
+        self.entries = deque()
+        self.length = 0
+
+        if conflated:
+            self.conflated = OrderedDict()
+
+        packets = []
+
+        for encoded_packets, volatile, size in entries:
+            packets.extend(encoded_packets)
+
+        if conflated:
+            for encoded_packets, size in conflated.values():
+                packets.extend(encoded_packets)
+
+        write_payload(conn, packets)
+
+        if self.paused and self.length <= self.low_watermark:
+            self.paused = False
+            self.notify('drain', self.length)
+
+    def notify(self, event, *args):
+        for socket in list(self.client.sockets):
+            socket._emit(event, *args)
+
+    def cancel(self):
+        """Cancels the pending flush."""
+        if self.scheduled is None:
+            return
+
+        if isinstance(self.scheduled, Timeout):
+            self.scheduled.cancel()
+        elif isinstance(self.scheduled, FlushQueue):
+            self.scheduled.discard(self)
+        elif self.scheduled is not gevent.getcurrent():
+            self.scheduled.kill(block=False)
+
+        self.scheduled = None
+
+    def clear(self):
+        """Discards queued packets."""
+        self.cancel()
+
+        self.entries = deque()
+        self.length = 0
+
+        if self.conflated:
+            self.conflated = OrderedDict()
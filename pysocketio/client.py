@@ -1,3 +1,9 @@
+from pysocketio.admission import EVENT_TYPES, RATE_LIMITED, TOO_MANY_NAMESPACES
+from pysocketio.buffer import WriteBuffer
+from pysocketio.dynamic import INVALID_NAMESPACE
+from pysocketio.metrics import clock, UNKNOWN_NAMESPACE
+from pysocketio.recovery import parse_pid
+from pysocketio import trace
 import pysocketio_parser as parser
 
 import logging
@@ -6,6 +12,13 @@ log = logging.getLogger(__name__)
 
 
 class Client(object):
+    # `__dict__` is only created once an application sets other attributes
+    __slots__ = (
+        'engine', 'conn', 'sid', 'request', 'serializer', 'buffer',
+        'sockets', 'nsps', 'connect_buffer', '_decoder', '_received',
+        'active', 'sent', 'reaper', '__dict__'
+    )
+
     def __init__(self, engine, conn):
         """Client constructor.
 
@@ -18,37 +31,93 @@ class Client(object):
         self.engine = engine
         self.conn = conn
 
-        self.encoder = parser.Encoder()
-        self.decoder = parser.Decoder()
+        # Created on the first incoming data
+        self._decoder = None
+        self._received = None
 
         self.sid = conn.sid
         self.request = conn.request
 
+        # Negotiated in the handshake query, JSON by default
+        self.serializer = engine.negotiate(conn.request)
+
+        self.buffer = None
+
+        if engine.buffer_options is not None:
+            self.buffer = WriteBuffer(self, **engine.buffer_options)
+
         self.setup()
 
         self.sockets = []
         self.nsps = {}
-        self.connect_buffer = []
+        self.connect_buffer = None
+
+        # Last inbound data, outbound writes since the last check and
+        # pending check (`pysocketio.idle`)
+        self.active = None
+        self.sent = False
+        self.reaper = None
+
+        if engine.idle is not None:
+            engine.idle.activity(self)
+
+    @property
+    def encoder(self):
+        """Packet encoder, encoders are stateless and shared by the engine."""
+        return self.engine.encoders[self.serializer]
+
+    @property
+    def decoder(self):
+        """Packet decoder, created on first use."""
+        if self._decoder is None:
+            self._decoder = self.serializer.decoder(**self.engine.decoder_options)
+            self._decoder.on('decoded', self.on_decoded)\
+                         .on('rejected', self.on_rejected)
+
+        return self._decoder
 
     def setup(self):
         """Sets up event listeners."""
         self.conn.on('data', self.on_data)\
                    .on('close', self.on_close)
 
-        self.decoder.on('decoded', self.on_decoded)
+        if self.buffer is not None:
+            self.buffer.attach()
 
-    def connect(self, name):
+    def connect(self, name, data=None):
         """Connects a client to a namespace.
 
         :param name: Namespace name
         :type name: str
+
+        :param data: Connect data (`CONNECT` packet data, or the handshake
+                     query), with the `pid` of a session to recover
+        :type data: dict
         """
-        log.debug('connecting to namespace "%s"', name)
+        if trace.client:
+            log.debug('connecting to namespace "%s"', name)
+
+        admission = self.engine.admission
+
+        if admission is not None and not admission.admit_namespace(self):
+            return admission.reject_namespace(self, TOO_MANY_NAMESPACES, name)
+
+        nsp = self.engine.namespaces.lookup(name)
+
+        if nsp is None:
+            log.debug('rejecting connection to unknown namespace "%s"', name)
 
-        nsp = self.engine.of(name)
+            return self.packet({
+                'type': parser.ERROR,
+                'nsp': name,
+                'data': INVALID_NAMESPACE
+            })
 
         if name != '/' and not self.nsps.get('/'):
-            self.connect_buffer.append(name)
+            if self.connect_buffer is None:
+                self.connect_buffer = []
+
+            self.connect_buffer.append((name, data))
             return
 
         def on_connected(socket):
@@ -57,12 +126,17 @@ class Client(object):
 
             if nsp.name == '/' and self.connect_buffer:
                 # Connect to buffered namespaces
-                for sub_name in self.connect_buffer:
-                    self.connect(sub_name)
+                for sub_name, sub_data in self.connect_buffer:
+                    self.connect(sub_name, sub_data)
 
                 self.connect_buffer = None
 
-        nsp.add(self, on_connected)
+        pid = None
+
+        if data and self.engine.recovery is not None:
+            pid = parse_pid(data)
+
+        nsp.add(self, on_connected, pid)
 
     def disconnect(self):
         """Disconnects from all namespaces and closes transport."""
@@ -80,17 +154,24 @@ class Client(object):
         self.sockets.remove(socket)
         del self.nsps[socket.nsp.name]
 
-    def close(self):
-        """Closes the underlying connection."""
+    def close(self, reason='forced server close'):
+        """Closes the underlying connection.
+
+        :param reason: Close reason
+        :type reason: str
+        """
         if self.conn.ready_state != 'open':
             return
 
         log.debug('forcing transport close')
 
+        if self.buffer is not None:
+            self.buffer.flush()
+
         self.conn.close()
-        self.on_close('forced server close')
+        self.on_close(reason)
 
-    def packet(self, packet, encoded=False, volatile=False):
+    def packet(self, packet, encoded=False, volatile=False, conflate=None):
         """Writes a packet to the transport.
 
         :param packet: Packet
@@ -101,34 +182,94 @@ class Client(object):
 
         :param volatile: Flag indicating the packet is volatile
         :type volatile: bool
+
+        :param conflate: Conflation key, only the latest pending packet
+                         of each key is sent
+        :type conflate: hashable
         """
         if self.conn.ready_state != 'open':
-            log.debug('ignoring packet write %s, transport not ready', packet)
+            if trace.client:
+                log.debug('ignoring packet write %s, transport not ready', packet)
+
             return
 
+        metrics = self.engine.metrics
+        started = clock() if metrics is not None else None
+
+        sampled = None if encoded else packet.get('trace')
+
         def write(encoded_packets):
-            if volatile and not self.conn.transport.writable:
+            if metrics is not None and not encoded:
+                metrics.observe('encode_seconds', clock() - started)
+
+            if volatile and conflate is None and not self.conn.transport.writable:
+                if sampled is not None:
+                    sampled.finish('dropped', self.sid)
+
+                return
+
+            self.sent = True
+
+            if metrics is not None:
+                metrics.inc('packets_out')
+                metrics.inc('bytes_out', value=sum([len(ep) for ep in encoded_packets]))
+
+            if conflate is not None:
+                self.conflate(encoded_packets, conflate)
+
+                if sampled is not None:
+                    sampled.finish('conflated', self.sid)
+
+                return
+
+            # Queue writes for the next flush
+            if self.buffer is not None:
+                self.buffer.write(encoded_packets, volatile)
+
+                if sampled is not None:
+                    sampled.finish('queued', self.sid)
+
                 return
 
             # Write each packet to socket
             for ep in encoded_packets:
                 self.conn.write(ep)
 
-        log.debug('writing packet %s', packet)
+            if sampled is not None:
+                sampled.finish('written', self.sid)
 
-        # Packet(s) already encoded, write them to socket
+        if trace.client:
+            log.debug('writing packet %s', packet)
+
+        # Packet(s) already encoded (by the default serializer), write them to socket
         if encoded:
-            return write(packet)
+            return write(self.engine.transcode(packet, self.serializer))
 
         # Encode packets, write them to socket
         self.encoder.encode(packet, write)
 
+    def conflate(self, encoded_packets, key):
+        """Queues encoded packets, replacing the pending packets of `key`."""
+        if self.buffer is None:
+            self.buffer = WriteBuffer(self)
+
+        self.buffer.conflate(encoded_packets, key)
+
     def on_data(self, data):
         """Called with incoming transport data.
 
         :param data: Data
         :type data: str
         """
+        metrics = self.engine.metrics
+
+        if metrics is not None:
+            metrics.inc('bytes_in', value=len(data))
+            self._received = clock()
+
+        if self.engine.idle is not None:
+            self.engine.idle.activity(self)
+
         self.decoder.add(data)
 
     def on_decoded(self, packet):
@@ -140,15 +281,77 @@ class Client(object):
         p_type = packet.get('type')
         p_nsp = packet.get('nsp')
 
+        metrics = self.engine.metrics
+
+        if metrics is not None:
+            if self._received is not None:
+                metrics.observe('decode_seconds', clock() - self._received)
+                self._received = None
+
+            # Namespaces sent by clients are only labelled once they exist
+            label = p_nsp if p_nsp in self.engine.nsps else UNKNOWN_NAMESPACE
+
+            metrics.inc('packets_in', (label, p_type))
+
+        if trace.sampler is not None:
+            trace.start(packet, 'inbound', 'decoded', (p_nsp, p_type))
+
+        try:
+            self.dispatch(packet, p_type, p_nsp)
+        finally:
+            sampled = packet.get('trace')
+
+            if sampled is not None:
+                sampled.finish('handled')
+
+    def on_rejected(self, reason, nsp):
+        """Called when the decoder rejects a packet over its limits.
+
+        :param reason: Rejection reason
+        :type reason: str
+
+        :param nsp: Namespace of the packet
+        :type nsp: str
+        """
+        if trace.client:
+            log.debug('packet from %s rejected: %s', self.sid, reason)
+
+        metrics = self.engine.metrics
+
+        if metrics is not None:
+            metrics.inc('packets_rejected', (reason,))
+
+        self.packet({
+            'type': parser.ERROR,
+            'nsp': nsp,
+            'data': reason
+        })
+
+    def dispatch(self, packet, p_type, p_nsp):
+        """Routes a decoded packet to the socket of its namespace."""
         if p_type == parser.CONNECT:
-            return self.connect(p_nsp)
+            return self.connect(p_nsp, packet.get('data'))
 
         socket = self.nsps.get(p_nsp)
 
         if not socket:
-            log.debug('no socket for namespace %s', p_nsp)
+            if trace.client:
+                log.debug('no socket for namespace %s', p_nsp)
+
             return
 
+        admission = self.engine.admission
+
+        if admission is not None and admission.event_rate and p_type in EVENT_TYPES:
+            if not admission.admit_event(socket):
+                if trace.client:
+                    log.debug('dropping event from %s, rate limited', self.sid)
+
+                if self.engine.metrics is not None:
+                    self.engine.metrics.inc('admission_rejected', (RATE_LIMITED,))
+
+                return
+
         return socket.on_packet(packet)
 
     def on_close(self, reason, description=None):
@@ -166,14 +369,32 @@ class Client(object):
         self.destroy()
 
         # `nsps` and `sockets` are cleaned up seamlessly
-        for socket in self.sockets:
+        for socket in list(self.sockets):
             socket.on_close(reason)
 
         # clean up decoder
-        self.decoder.destroy()
+        if self._decoder is not None:
+            self._decoder.destroy()
+            self._decoder = None
+
+        # discard unsent packets
+        if self.buffer is not None:
+            self.buffer.clear()
+
+        if self.engine.admission is not None:
+            self.engine.admission.release(self)
+
+        if self.reaper is not None:
+            self.reaper.cancel()
+            self.reaper = None
 
     def destroy(self):
         self.conn.off('data')\
                    .off('close')
 
-        self.decoder.off('decoded')
+        if self._decoder is not None:
+            self._decoder.off('decoded')\
+                         .off('rejected')
+
+        if self.buffer is not None:
+            self.buffer.detach()
@@ -0,0 +1,5 @@
+from pysocketio.cluster.adapter import ClusterAdapter
+from pysocketio.cluster.bus import Bus
+from pysocketio.cluster.unix import UnixBroker, UnixBus
+
+__all__ = ['ClusterAdapter', 'Bus', 'UnixBroker', 'UnixBus']
@@ -0,0 +1,213 @@
+from pysocketio.adapter import Adapter
+from pysocketio.cluster.bus import binary
+
+import logging
+import uuid
+
+log = logging.getLogger(__name__)
+
+
+class ClusterAdapter(Adapter):
+    #: Message bus shared by every namespace, see `ClusterAdapter.using()`
+    bus = None
+
+    #: Channel prefix
+    prefix = 'pysocketio'
+
+    #: Seconds to wait for sibling nodes to answer a request
+    timeout = 5.0
+
+    def __init__(self, nsp):
+        """Adapter which publishes broadcasts to the other nodes on `bus`.
+
+        Packets are encoded once, the encoded frames are shipped over the
+        bus and written as-is to the recipients on each node.
+
+        :param nsp: Namespace
+        :type nsp: pysocketio.namespace.Namespace
+        """
+        super(ClusterAdapter, self).__init__(nsp)
+
+        if self.bus is None:
+            raise ValueError('No bus configured, use ClusterAdapter.using(bus)')
+
+        self.key = '%s#%s' % (self.prefix, nsp.name)
+
+        self.requests = {}
+
+        self.bus.subscribe(self.key, self.on_broadcast)
+        self.bus.subscribe(self.key + '#request', self.on_request)
+        self.bus.subscribe(self.response_channel(self.bus.uid), self.on_response)
+
+    @classmethod
+    def using(cls, bus, prefix=None, timeout=None):
+        """Builds an adapter class bound to `bus`.
+
+            engine.adapter(ClusterAdapter.using(UnixBus('/tmp/pysocketio.sock')))
+
+        :param bus: Message bus
+        :type bus: pysocketio.cluster.bus.Bus
+
+        :param prefix: Channel prefix
+        :type prefix: str
+
+        :param timeout: Seconds to wait for sibling nodes to answer a request
+        :type timeout: float
+        """
+        return type(cls.__name__, (cls,), {
+            'bus': bus,
+            'prefix': prefix or cls.prefix,
+            'timeout': timeout or cls.timeout
+        })
+
+    def close(self):
+        self.bus.unsubscribe(self.key, self.on_broadcast)
+        self.bus.unsubscribe(self.key + '#request', self.on_request)
+        self.bus.unsubscribe(self.response_channel(self.bus.uid), self.on_response)
+
+        for rid in list(self.requests):
+            self.finish(rid)
+
+    def response_channel(self, uid):
+        return '%s#response#%s' % (self.key, uid)
+
+    def deliver(self, encoded_packets, options):
+        count = super(ClusterAdapter, self).deliver(encoded_packets, options)
+
+        flags = options.get('flags') or {}
+
+        if flags.get('local'):
+            return count
+
+        self.bus.publish(self.key, {
+            'uid': self.bus.uid,
+            'frames': self.frames(encoded_packets),
+            'rooms': list(options.get('rooms') or []),
+            'except': list(options.get('except') or []),
+            'flags': flags
+        })
+
+        return count
+
+    def frames(self, encoded_packets):
+        """Marks the binary frames of encoded packets for the bus, the
+           attachments following the header (every frame of binary
+           serializers)."""
+        start = 0 if self.nsp.engine.encoder.binary else 1
+
+        return encoded_packets[:start] + [binary(frame) for frame in encoded_packets[start:]]
+
+    def on_broadcast(self, message):
+        if message.get('uid') == self.bus.uid:
+            return
+
+        Adapter.deliver(self, message['frames'], message)
+
+    def clients(self, rooms=None, callback=None):
+        """Retrieves the socket ids in `rooms` (all sockets if empty)
+           across every node, answers are asynchronous: the ids are only
+           passed to `callback`, nothing is returned.
+
+        :param rooms: Room names
+        :type rooms: list
+
+        :param callback: Callback function, called with the socket ids
+        :type callback: function
+
+        :raises ValueError: If `callback` is missing
+        """
+        self.request('clients', callback, rooms=list(rooms or []))
+
+    def socket_rooms(self, sid, callback=None):
+        """Retrieves the rooms a socket has joined, on any node, answers
+           are asynchronous: the rooms are only passed to `callback`,
+           nothing is returned.
+
+        :param sid: Socket id
+        :type sid: str
+
+        :param callback: Callback function, called with the room names
+        :type callback: function
+
+        :raises ValueError: If `callback` is missing
+        """
+        self.request('socket_rooms', callback, sid=sid)
+
+    def resolve(self, kind, args):
+        """Answers a request from the local room index."""
+        if kind == 'clients':
+            return Adapter.clients(self, args.get('rooms'))
+
+        if kind == 'socket_rooms':
+            return Adapter.socket_rooms(self, args.get('sid'))
+
+        raise ValueError('Unknown request %r' % kind)
+
+    def request(self, kind, callback, **args):
+        """Sends a request to the sibling nodes, `callback` is called with
+           the union of every answer (partial after `timeout`)."""
+        if callback is None:
+            raise ValueError('%s() requires a callback when clustered' % kind)
+
+        result = set(self.resolve(kind, args))
+
+        if not self.bus.peers:
+            return callback(result)
+
+        rid = uuid.uuid4().hex
+
+        self.requests[rid] = {
+            'callback': callback,
+            'result': result,
+            'remaining': self.bus.peers,
+            'timer': self.nsp.engine.timer.schedule(self.timeout, self.finish, rid)
+        }
+
+        self.bus.publish(self.key + '#request', {
+            'uid': self.bus.uid,
+            'id': rid,
+            'kind': kind,
+            'args': args
+        })
+
+    def on_request(self, message):
+        if message.get('uid') == self.bus.uid:
+            return
+
+        try:
+            result = self.resolve(message['kind'], message.get('args') or {})
+        except ValueError as ex:
+            log.debug('ignoring request: %s', ex)
+            return
+
+        self.bus.publish(self.response_channel(message['uid']), {
+            'id': message['id'],
+            'result': list(result)
+        })
+
+    def on_response(self, message):
+        request = self.requests.get(message.get('id'))
+
+        if request is None:
+            log.debug('ignoring response for unknown request %s', message.get('id'))
+            return
+
+        request['result'].update(message.get('result') or [])
+        request['remaining'] -= 1
+
+        if request['remaining'] <= 0:
+            self.finish(message['id'])
+
+    def finish(self, rid):
+        request = self.requests.pop(rid, None)
+
+        if request is None:
+            return
+
+        request['timer'].cancel()
+
+        if request['remaining'] > 0:
+            log.debug('request %s timed out, %s node(s) did not answer', rid, request['remaining'])
+
+        if request['callback']:
+            request['callback'](request['result'])
@@ -0,0 +1,100 @@
+from base64 import b64decode, b64encode
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Bus(object):
+    def __init__(self):
+        """Message bus interface used by `ClusterAdapter` to reach
+           sibling nodes.
+
+        Implementations deliver each published message to the
+        subscribers of every *other* node, and keep `peers` updated
+        with the number of other nodes connected to the bus.
+        """
+        self.uid = None
+        self.peers = 0
+
+        self.subscriptions = {}
+
+    def publish(self, channel, message):
+        """Publishes a message to other nodes.
+
+        :param channel: Channel name
+        :type channel: str
+
+        :param message: Message
+        :type message: dict
+        """
+        raise NotImplementedError()
+
+    def subscribe(self, channel, callback):
+        """Subscribes to messages published on a channel.
+
+        :param channel: Channel name
+        :type channel: str
+
+        :param callback: Callback function, called with each message
+        :type callback: function
+        """
+        self.subscriptions.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, channel, callback=None):
+        """Removes a channel subscription.
+
+        :param channel: Channel name
+        :type channel: str
+
+        :param callback: Callback function (all callbacks if `None`)
+        :type callback: function
+        """
+        callbacks = self.subscriptions.get(channel)
+
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+        if not callbacks or callback is None:
+            self.subscriptions.pop(channel, None)
+
+    def dispatch(self, channel, message):
+        """Calls the subscribers of a channel with a received message."""
+        for callback in list(self.subscriptions.get(channel) or []):
+            try:
+                callback(message)
+            except Exception as ex:
+                log.warn('error while handling %s message: %s', channel, ex, exc_info=True)
+
+
+def binary(data):
+    """Marks a frame as binary for `dumps`, received back as `bytes`."""
+    return {'$binary': b64encode(bytes(data)).decode('ascii')}
+
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return binary(obj)
+
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and '$binary' in obj:
+        return b64decode(obj['$binary'])
+
+    return obj
+
+
+def dumps(message):
+    """Serializes a bus message, binary frames and room sets included
+       (python 2 `str` values are text, mark frames with `binary`)."""
+    return json.dumps(message, default=_default, separators=(',', ':'))
+
+
+def loads(data):
+    """Deserializes a bus message."""
+    return json.loads(data, object_hook=_object_hook)
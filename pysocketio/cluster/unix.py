@@ -0,0 +1,264 @@
+"""Unix socket bus, connects the nodes of a single machine through
+a local broker process.
+
+    python -m pysocketio.cluster.unix /tmp/pysocketio.sock
+"""
+from pysocketio.cluster.bus import Bus, dumps, loads
+
+from gevent import socket
+from gevent.lock import Semaphore
+from gevent.server import StreamServer
+import gevent
+import logging
+import os
+import struct
+import sys
+import uuid
+
+log = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+
+#: Broker control channel, carries the number of connected nodes
+PEERS_CHANNEL = '$peers'
+
+#: Default maximum frame size (bytes)
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def write_frame(sock, lock, body):
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+
+    with lock:
+        sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def read_frames(sock, max_size=MAX_FRAME_SIZE):
+    """Yields each length-prefixed frame read from `sock`.
+
+    :raises ValueError: On frames over `max_size` bytes
+    """
+    buf = bytearray()
+    offset = 0
+
+    while True:
+        chunk = sock.recv(65536)
+
+        if not chunk:
+            return
+
+        buf += chunk
+
+        while len(buf) - offset >= HEADER.size:
+            length, = HEADER.unpack_from(buf, offset)
+
+            if max_size and length > max_size:
+                raise ValueError('Frame of %d bytes exceeds %d bytes' % (length, max_size))
+
+            end = offset + HEADER.size + length
+
+            if len(buf) < end:
+                break
+
+            yield bytes(buf[offset + HEADER.size:end])
+            offset = end
+
+        # Drop read frames once they outweigh the pending data
+        if offset and offset >= len(buf) - offset:
+            del buf[:offset]
+            offset = 0
+
+
+class UnixBroker(object):
+    def __init__(self, path, mode=0o600, max_frame_size=MAX_FRAME_SIZE):
+        """Relays frames between the nodes connected to a unix socket.
+
+        :param path: Socket path
+        :type path: str
+
+        :param mode: Socket file permissions
+        :type mode: int
+
+        :param max_frame_size: Maximum frame size (bytes), nodes sending
+                               larger frames are disconnected
+        :type max_frame_size: int
+        """
+        self.path = path
+        self.mode = mode
+        self.max_frame_size = max_frame_size
+
+        self.server = None
+        self.connections = {}
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(128)
+
+        os.chmod(self.path, self.mode)
+
+        self.server = StreamServer(listener, self.handle)
+        self.server.start()
+
+        log.debug('broker listening on %s', self.path)
+        return self
+
+    def serve_forever(self):
+        if self.server is None:
+            self.start()
+
+        self.server.serve_forever()
+
+    def stop(self):
+        if self.server is None:
+            return
+
+        self.server.stop()
+        self.server = None
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def handle(self, sock, address):
+        self.connections[sock] = Semaphore()
+        self.announce()
+
+        try:
+            for body in read_frames(sock, self.max_frame_size):
+                self.relay(sock, body)
+        except socket.error as ex:
+            log.debug('node connection error: %s', ex)
+        except ValueError as ex:
+            log.warn('disconnecting node: %s', ex)
+        finally:
+            del self.connections[sock]
+            self.announce()
+
+            sock.close()
+
+    def relay(self, source, body):
+        for sock, lock in list(self.connections.items()):
+            if sock is source:
+                continue
+
+            try:
+                write_frame(sock, lock, body)
+            except socket.error as ex:
+                log.debug('unable to relay frame: %s', ex)
+
+    def announce(self):
+        body = dumps({'channel': PEERS_CHANNEL, 'message': len(self.connections)})
+
+        for sock, lock in list(self.connections.items()):
+            try:
+                write_frame(sock, lock, body)
+            except socket.error:
+                pass
+
+
+class UnixBus(Bus):
+    def __init__(self, path, reconnect_delay=1.0, max_frame_size=MAX_FRAME_SIZE):
+        """Bus client for a `UnixBroker`.
+
+        :param path: Broker socket path
+        :type path: str
+
+        :param reconnect_delay: Seconds to wait before reconnecting
+        :type reconnect_delay: float
+
+        :param max_frame_size: Maximum frame size (bytes), the broker
+                               connection is reset on larger frames
+        :type max_frame_size: int
+        """
+        super(UnixBus, self).__init__()
+
+        self.uid = uuid.uuid4().hex
+
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.max_frame_size = max_frame_size
+
+        self.sock = None
+        self.lock = Semaphore()
+        self.reader = None
+
+    def connect(self):
+        """Starts the connection to the broker (if not already started)."""
+        if self.reader is None:
+            self.reader = gevent.spawn(self.run)
+
+        return self
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.kill(block=False)
+            self.reader = None
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+        self.peers = 0
+
+    def subscribe(self, channel, callback):
+        super(UnixBus, self).subscribe(channel, callback)
+        self.connect()
+
+    def publish(self, channel, message):
+        if self.sock is None:
+            log.debug('dropping %s message, not connected to broker', channel)
+            return
+
+        try:
+            data = dumps({'channel': channel, 'message': message})
+        except (TypeError, ValueError) as ex:
+            log.warn('unable to serialize %s message: %s', channel, ex)
+            return
+
+        try:
+            write_frame(self.sock, self.lock, data)
+        except socket.error as ex:
+            log.warn('unable to publish %s message: %s', channel, ex)
+
+    def run(self):
+        while True:
+            try:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path)
+
+                log.debug('connected to broker at %s', self.path)
+
+                for body in read_frames(self.sock, self.max_frame_size):
+                    self.on_frame(body)
+            except socket.error as ex:
+                log.debug('broker connection error: %s', ex)
+            except ValueError as ex:
+                log.warn('resetting broker connection: %s', ex)
+
+            if self.sock is not None:
+                self.sock.close()
+
+            self.sock = None
+            self.peers = 0
+
+            gevent.sleep(self.reconnect_delay)
+
+    def on_frame(self, body):
+        frame = loads(body.decode('utf-8'))
+        channel = frame.get('channel')
+
+        if channel == PEERS_CHANNEL:
+            self.peers = max(frame['message'] - 1, 0)
+            return
+
+        self.dispatch(channel, frame.get('message'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    UnixBroker(sys.argv[1] if len(sys.argv) > 1 else '/tmp/pysocketio.sock').serve_forever()
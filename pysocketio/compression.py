@@ -0,0 +1,297 @@
+"""Per-message compression (permessage-deflate, RFC 7692).
+
+Enabled for websocket transports with the engine `compression` option:
+
+    Engine({'compression': {
+        'threshold': 1024,          # minimum message size (bytes)
+        'level': 6,
+        'context_takeover': False   # stateless (default) or shared context
+    }})
+
+With context takeover each connection keeps a compressor (and the
+client an inflater) for its whole lifetime, giving the best ratio for
+small repetitive messages at ~300KB of memory per connection. Stateless
+mode compresses each message on its own, without per-connection state,
+identical messages (broadcast frames) are compressed once and shared
+between recipients.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import zlib
+
+log = logging.getLogger(__name__)
+
+EXTENSION = 'permessage-deflate'
+
+#: Trailer removed from (and appended to) each compressed message
+TAIL = b'\x00\x00\xff\xff'
+
+
+def parse_extensions(header):
+    """Parses a `Sec-WebSocket-Extensions` header.
+
+    :return: List of `(name, {param: value})` offers
+    :rtype: list
+    """
+    offers = []
+
+    for offer in (header or '').split(','):
+        parts = [part.strip() for part in offer.split(';')]
+
+        if not parts[0]:
+            continue
+
+        params = {}
+
+        for part in parts[1:]:
+            if not part:
+                continue
+
+            key, _, value = part.partition('=')
+            params[key.strip()] = value.strip().strip('"') or None
+
+        offers.append((parts[0], params))
+
+    return offers
+
+
+def window_bits(value, default):
+    if value is None:
+        return default
+
+    try:
+        bits = int(value)
+    except ValueError:
+        return None
+
+    if not 8 <= bits <= 15:
+        return None
+
+    return bits
+
+
+class Deflate(object):
+    def __init__(self, threshold=1024, level=6, context_takeover=False,
+                 window_bits=15, memory_level=8, cache_size=256,
+                 cache_max_size=64 * 1024, max_size=16 * 1024 * 1024):
+        """permessage-deflate configuration, shared by every connection.
+
+        :param threshold: Minimum message size compressed (bytes)
+        :type threshold: int
+
+        :param level: Compression level (1-9)
+        :type level: int
+
+        :param context_takeover: Keep compression context between messages
+        :type context_takeover: bool
+
+        :param window_bits: Server window size (9-15)
+        :type window_bits: int
+
+        :param memory_level: Compressor memory level (1-9)
+        :type memory_level: int
+
+        :param cache_size: Stateless compressed messages kept for reuse
+        :type cache_size: int
+
+        :param cache_max_size: Largest message kept for reuse (bytes)
+        :type cache_max_size: int
+
+        :param max_size: Maximum inflated message size (bytes)
+        :type max_size: int
+        """
+        self.threshold = threshold
+        self.level = level
+        self.context_takeover = context_takeover
+        self.window_bits = window_bits
+        self.memory_level = memory_level
+
+        self.max_size = max_size
+
+        self.cache_size = cache_size
+        self.cache_max_size = cache_max_size
+        self.cache = OrderedDict()
+
+    def negotiate(self, header):
+        """Accepts the first valid permessage-deflate offer.
+
+        :param header: `Sec-WebSocket-Extensions` request header
+        :type header: str
+
+        :return: Response header and connection parameters, `None` if declined
+        :rtype: (str, dict)
+        """
+        for name, params in parse_extensions(header):
+            if name != EXTENSION:
+                continue
+
+            accepted = self.accept(params)
+
+            if accepted is not None:
+                return accepted
+
+        return None
+
+    def accept(self, params):
+        response = [EXTENSION]
+
+        # Server (outbound) context
+        takeover = self.context_takeover and 'server_no_context_takeover' not in params
+
+        if not takeover:
+            response.append('server_no_context_takeover')
+
+        bits = self.window_bits
+
+        if 'server_max_window_bits' in params:
+            limit = window_bits(params['server_max_window_bits'], None)
+
+            if limit is None:
+                return None
+
+            bits = min(bits, limit)
+
+            if bits < 9:
+                # zlib can't produce raw deflate streams with 256 byte
+                # windows, answering more than requested isn't allowed
+                return None
+
+        if bits < 15 or 'server_max_window_bits' in params:
+            response.append('server_max_window_bits=%d' % bits)
+
+        # Client (inbound) context, stateless connections don't keep inflaters
+        if 'client_max_window_bits' in params and window_bits(params['client_max_window_bits'], 15) is None:
+            return None
+
+        inflate_takeover = self.context_takeover and 'client_no_context_takeover' not in params
+
+        if not inflate_takeover:
+            response.append('client_no_context_takeover')
+
+        return '; '.join(response), {
+            'takeover': takeover,
+            'window_bits': bits,
+            'inflate_takeover': inflate_takeover
+        }
+
+    def compressor(self, params):
+        return Compressor(self, params['window_bits'], params['takeover'])
+
+    def decompressor(self, params):
+        return Decompressor(self.max_size, params['inflate_takeover'])
+
+    def compressobj(self, bits):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -bits, self.memory_level)
+
+    def compress_once(self, data, bits):
+        """Compresses a message without context, identical messages
+           are only compressed once (up to `cache_max_size` bytes)."""
+        cached = self.cache_size and len(data) <= self.cache_max_size
+
+        if cached:
+            # Messages are identified by digest, not kept alive by the cache
+            key = (bits, hashlib.sha1(data).digest())
+            result = self.cache.pop(key, None)
+        else:
+            result = None
+
+        if result is None:
+            compressor = self.compressobj(bits)
+            result = strip_tail(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        if not cached:
+            return result
+
+        while len(self.cache) >= self.cache_size:
+            self.cache.popitem(last=False)
+
+        # Most recently used last
+        self.cache[key] = result
+
+        return result
+
+
+def strip_tail(data):
+    if data.endswith(TAIL):
+        return data[:-len(TAIL)]
+
+    return data
+
+
+class Compressor(object):
+    __slots__ = ('deflate', 'window_bits', 'compressobj')
+
+    def __init__(self, deflate, window_bits, takeover):
+        """Connection compressor.
+
+        :param deflate: Configuration
+        :type deflate: Deflate
+        """
+        self.deflate = deflate
+        self.window_bits = window_bits
+
+        self.compressobj = deflate.compressobj(window_bits) if takeover else None
+
+    def compress(self, data):
+        """Compresses a message payload.
+
+        :return: Compressed payload, `None` if below the threshold
+        :rtype: bytes
+        """
+        if len(data) < self.deflate.threshold:
+            return None
+
+        if self.compressobj is None:
+            return self.deflate.compress_once(data, self.window_bits)
+
+        return strip_tail(self.compressobj.compress(data) + self.compressobj.flush(zlib.Z_SYNC_FLUSH))
+
+
+class Decompressor(object):
+    __slots__ = ('max_size', 'takeover', 'decompressobj', 'size')
+
+    def __init__(self, max_size, takeover):
+        """Connection decompressor, fed the payload of each frame
+           of a compressed message."""
+        self.max_size = max_size
+        self.takeover = takeover
+
+        self.decompressobj = None
+        self.size = 0
+
+    def decompress(self, data, fin):
+        """Inflates a frame payload.
+
+        :param data: Compressed payload
+        :type data: bytes
+
+        :param fin: Last frame of the message
+        :type fin: bool
+        """
+        if self.decompressobj is None:
+            self.decompressobj = zlib.decompressobj(-15)
+
+        if fin:
+            data += TAIL
+
+        if self.max_size:
+            result = self.decompressobj.decompress(data, self.max_size - self.size + 1)
+
+            if self.decompressobj.unconsumed_tail:
+                raise ValueError('Message exceeds %d bytes' % self.max_size)
+        else:
+            result = self.decompressobj.decompress(data)
+
+        self.size += len(result)
+
+        if self.max_size and self.size > self.max_size:
+            raise ValueError('Message exceeds %d bytes' % self.max_size)
+
+        if fin:
+            self.size = 0
+
+            if not self.takeover:
+                self.decompressobj = None
+
+        return result
@@ -0,0 +1,291 @@
+"""Dynamic namespaces.
+
+Namespaces matching a pattern are created when a client first connects
+to them, as children of a shared parent namespace:
+
+    tenants = io.of('/tenants/*')
+    tenants.use(authorize)
+
+    @tenants.route('message')
+    def on_message(socket, message):
+        socket.nsp.emit('message', message)     # to the tenant namespace
+
+Patterns are `*` globs matching a single path segment (compiled into a
+segment trie, checked once per new namespace name), compiled regular
+expressions or functions called with the name. Children share the
+middleware and routes of their parent, and `connect`/`connection` are
+emitted on both. Emitting on the parent broadcasts to every child.
+
+With the `strict_namespaces` engine option, clients may only connect to
+namespaces created by the server or matching a pattern. Otherwise other
+names create plain namespaces, kept until the server looks them up with
+`of()`. Empty children and client-created namespaces are evicted, least
+recently used first, once there are more than `max_dynamic_namespaces`
+(default 1000).
+"""
+from pysocketio.namespace import Namespace
+
+from collections import OrderedDict
+import logging
+
+log = logging.getLogger(__name__)
+
+TEXT_TYPES = (str, type(u''))
+
+#: Error sent to clients connecting to an unknown (strict mode) or
+#: pattern namespace
+INVALID_NAMESPACE = 'Invalid namespace'
+
+#: Names recently rejected or matched, kept to skip matching again
+CACHE_SIZE = 1024
+
+
+def is_pattern(name):
+    return not isinstance(name, TEXT_TYPES) or '*' in name
+
+
+class PatternTrie(object):
+    def __init__(self):
+        """Matches namespace names against the registered patterns,
+           globs are indexed by path segment, regular expressions and
+           functions are tried in registration order."""
+        self.root = {}
+        self.matchers = []
+
+    def add(self, pattern, parent):
+        if not isinstance(pattern, TEXT_TYPES):
+            match = getattr(pattern, 'match', None) or pattern
+            self.matchers.append((match, parent))
+            return
+
+        node = self.root
+
+        for segment in pattern.split('/'):
+            node = node.setdefault(segment, {})
+
+        node[None] = parent
+
+    def match(self, name):
+        """Retrieves the parent namespace of `name`, `None` if no
+           pattern matches."""
+        parent = self._walk(self.root, name.split('/'), 0)
+
+        if parent is not None:
+            return parent
+
+        for match, parent in self.matchers:
+            if match(name):
+                return parent
+
+        return None
+
+    def _walk(self, node, segments, position):
+        if position == len(segments):
+            return node.get(None)
+
+        # Literal segments take precedence over wildcards
+        for key in (segments[position], '*'):
+            child = node.get(key)
+
+            if child is None or (key == '*' and not segments[position]):
+                continue
+
+            parent = self._walk(child, segments, position + 1)
+
+            if parent is not None:
+                return parent
+
+        return None
+
+
+class ParentNamespace(Namespace):
+    def __init__(self, engine, pattern):
+        """Namespace shared by the dynamic namespaces matching `pattern`.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param pattern: Glob, compiled regular expression or function
+        :type pattern: str or re.RegexObject or function
+        """
+        name = pattern if isinstance(pattern, TEXT_TYPES) else getattr(pattern, 'pattern', repr(pattern))
+
+        super(ParentNamespace, self).__init__(engine, name)
+
+        self.pattern = pattern
+        self.children = {}
+
+    def child(self, name):
+        """Creates the dynamic namespace `name`.
+
+        :param name: Namespace name
+        :type name: str
+        """
+        log.debug('initializing dynamic namespace "%s"', name)
+
+        nsp = Namespace(self.engine, name)
+        nsp.parent = self
+
+        # Shared, not copied
+        nsp.middleware = self.middleware
+        nsp.routes = self.routes
+        nsp.executors = self.executors
+        nsp.executor = self.executor
+
+        self.children[name] = nsp
+        return nsp
+
+    def emit(self, *args):
+        """Emits to all clients of every child namespace."""
+        rooms, flags = self.rooms, self.flags
+
+        self.rooms = set()
+        self.flags = {}
+
+        for nsp in list(self.children.values()):
+            nsp.rooms = set(rooms)
+            nsp.flags = dict(flags)
+
+            nsp.emit(*args)
+
+        return self
+
+
+class Registry(object):
+    def __init__(self, engine, strict=False, max_dynamic=1000):
+        """Resolves the namespaces clients connect to.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param strict: Reject unknown namespaces (allowlist mode)
+        :type strict: bool
+
+        :param max_dynamic: Dynamic namespaces kept once empty
+        :type max_dynamic: int
+        """
+        self.engine = engine
+
+        self.strict = strict
+        self.max_dynamic = max_dynamic
+
+        self.trie = PatternTrie()
+        self.parents = {}
+
+        # Dynamic and client-created namespaces, least recently
+        # connected first
+        self.dynamic = OrderedDict()
+
+        # name -> parent (`None` when unmatched), see `CACHE_SIZE`
+        self.cache = OrderedDict()
+
+    def parent(self, pattern):
+        """Retrieves (or creates) the parent namespace of `pattern`."""
+        parent = self.parents.get(pattern)
+
+        if parent is None:
+            parent = self.parents[pattern] = ParentNamespace(self.engine, pattern)
+
+            self.trie.add(pattern, parent)
+            self.cache.clear()
+
+        return parent
+
+    def lookup(self, name):
+        """Resolves the namespace a client connects to, names containing
+           `*` are rejected.
+
+        :return: Namespace, `None` if rejected
+        :rtype: pysocketio.namespace.Namespace
+        """
+        nsp = self.engine.nsps.get(name)
+
+        if nsp is not None:
+            self.touch(name)
+            return nsp
+
+        if '*' in name:
+            # Only the server registers patterns
+            return None
+
+        parent = self.match(name)
+
+        if parent is not None:
+            return self.add(parent, name)
+
+        if self.strict:
+            return None
+
+        log.debug('initializing namespace "%s" for a client', name)
+
+        return self.add(None, name)
+
+    def add(self, parent, name):
+        """Creates the dynamic namespace `name`, a child of `parent`
+           (a plain namespace if `None`)."""
+        if parent is not None:
+            nsp = parent.child(name)
+        else:
+            nsp = Namespace(self.engine, name)
+
+        self.engine.nsps[name] = nsp
+        self.dynamic[name] = nsp
+
+        self.evict(nsp)
+        return nsp
+
+    def match(self, name):
+        if not self.parents:
+            return None
+
+        if name in self.cache:
+            self.cache[name] = parent = self.cache.pop(name)
+            return parent
+
+        parent = self.trie.match(name)
+
+        while len(self.cache) >= CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+        self.cache[name] = parent
+        return parent
+
+    def claim(self, nsp):
+        """Keeps a client-created namespace looked up by the server."""
+        if nsp.parent is None:
+            self.dynamic.pop(nsp.name, None)
+
+    def touch(self, name):
+        nsp = self.dynamic.pop(name, None)
+
+        if nsp is not None:
+            self.dynamic[name] = nsp
+
+    def evict(self, keep=None):
+        """Removes the least recently used empty dynamic namespaces over
+           `max_dynamic`, busy namespaces (and `keep`) are kept."""
+        excess = len(self.dynamic) - self.max_dynamic
+
+        if excess <= 0:
+            return
+
+        for name, nsp in list(self.dynamic.items()):
+            if excess <= 0:
+                break
+
+            if nsp is keep or not nsp.empty:
+                continue
+
+            self.remove(nsp)
+            excess -= 1
+
+    def remove(self, nsp):
+        log.debug('evicting dynamic namespace "%s"', nsp.name)
+
+        self.dynamic.pop(nsp.name, None)
+        self.engine.nsps.pop(nsp.name, None)
+
+        if nsp.parent is not None:
+            nsp.parent.children.pop(nsp.name, None)
+
+        nsp.adapter.close()
@@ -0,0 +1,101 @@
+"""Event emitter for classes with `__slots__`.
+
+`pyemitter.Emitter` keeps its listeners in the instance `__dict__`, a
+subclass with `__slots__` still gets one. Classes allocated for each
+connection use `SlottedEmitter` instead (same `on`, `once`, `off` and
+`emit` methods), listeners are kept in a slot set on first use.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SlottedEmitter(object):
+    __slots__ = ('_listeners',)
+
+    def _callbacks(self, create=False):
+        try:
+            listeners = self._listeners
+        except AttributeError:
+            listeners = self._listeners = None
+
+        if listeners is None and create:
+            listeners = self._listeners = {}
+
+        return listeners
+
+    def on(self, event, func=None):
+        """Adds a listener for `event`, used as a decorator if
+           `func` is omitted."""
+        def wrap(func):
+            self._callbacks(True).setdefault(event, []).append(func)
+            return func
+
+        if func is None:
+            return wrap
+
+        wrap(func)
+        return self
+
+    def once(self, event, func=None):
+        """Adds a listener called with the next `event` only."""
+        def wrap(func):
+            def once(*args, **kwargs):
+                self.off(event, once)
+                return func(*args, **kwargs)
+
+            self.on(event, once)
+            return func
+
+        if func is None:
+            return wrap
+
+        wrap(func)
+        return self
+
+    def off(self, event=None, func=None):
+        """Removes the listeners of `event` (`func` only if provided),
+           every listener if `event` is `None`."""
+        listeners = self._callbacks()
+
+        if not listeners:
+            return self
+
+        if event is None:
+            self._listeners = None
+        elif func is None:
+            listeners.pop(event, None)
+        else:
+            callbacks = listeners.get(event)
+
+            if callbacks and func in callbacks:
+                callbacks.remove(func)
+
+            if not callbacks:
+                listeners.pop(event, None)
+
+        return self
+
+    def emit(self, event, *args, **kwargs):
+        """Calls the listeners of `event`."""
+        listeners = self._callbacks()
+
+        if not listeners:
+            return self
+
+        try:
+            callbacks = listeners.get(event)
+        except TypeError:
+            # Unhashable event names (sent by clients) have no listeners
+            return self
+
+        if not callbacks:
+            return self
+
+        for func in list(callbacks):
+            try:
+                func(*args, **kwargs)
+            except Exception as ex:
+                log.warn('error in %r listener: %s', event, ex, exc_info=True)
+
+        return self
@@ -1,6 +1,16 @@
+from pysocketio.adapter import Adapter
+from pysocketio.admission import AdmissionController
+from pysocketio.buffer import FlushQueue
 from pysocketio.client import Client
+from pysocketio.compression import Deflate
+from pysocketio.dynamic import Registry, is_pattern
+from pysocketio.idle import IdleReaper
+from pysocketio.metrics import Metrics
 from pysocketio.namespace import Namespace
-from pysocketio_adapter import Adapter
+from pysocketio.recovery import Recovery
+from pysocketio.timer import TimerWheel
+from pysocketio import serializer
+from pysocketio import trace
 import pyengineio
 
 from pyemitter import Emitter
@@ -22,14 +32,114 @@ class Engine(Emitter):
         options['path'] = options.get('path') or '/socket.io'
 
         # Setup
+        self.options = options
         self._adapter = None
 
+        # Packet serializers (`json`, `fast`, `msgpack`), JSON by default,
+        # others selected per client in the handshake query. Encoders
+        # are shared by the clients of each serializer.
+        self.serializer, self.serializers = serializer.create_all(options.get('serializer'))
+        self.encoder = self.serializer.encoder()
+
+        self.encoders = {self.serializer: self.encoder}
+        self.transcoders = {}
+
+        for value in self.serializers.values():
+            if value not in self.encoders:
+                self.encoders[value] = value.encoder()
+
+        # Inbound packet limits, larger packets are rejected by decoders
+        self.decoder_options = {
+            'max_size': options.get('max_packet_size'),
+            'max_attachments': options.get('max_attachments')
+        }
+
+        # Deadlines of every connection (`pysocketio.timer.TimerWheel` options)
+        self.timer = TimerWheel(**(options.get('timer') or {}))
+
+        # Write buffers flushed at the end of the loop turn
+        self.flushes = FlushQueue()
+
+        # Seconds before unanswered acks are discarded
+        self.ack_timeout = options.get('ack_timeout', 60.0)
+
+        # Events queued per socket behind a running off-loop handler
+        self.max_queued_events = options.get('max_queued_events', 1000)
+
+        # Metrics registry (`True` or `pysocketio.metrics.Metrics` options)
+        self.metrics = None
+
+        metrics = options.get('metrics')
+
+        if metrics:
+            self.metrics = Metrics(self, **(metrics if metrics is not True else {}))
+
+        # Admission control (`pysocketio.admission.AdmissionController` options)
+        self.admission = None
+
+        admission = options.get('admission')
+
+        if admission:
+            self.admission = AdmissionController(self, **admission)
+
+        # Websocket compression (`pysocketio.compression.Deflate` options)
+        self.deflate = None
+
+        compression = options.get('compression')
+
+        if compression:
+            self.deflate = Deflate(**(compression if compression is not True else {}))
+
+        # Connection state recovery (`pysocketio.recovery.Recovery` options)
+        self.recovery = None
+
+        recovery = options.get('recovery')
+
+        if recovery:
+            self.recovery = Recovery(self, **(recovery if recovery is not True else {}))
+
+        # Idle clients (`pysocketio.idle.IdleReaper` options)
+        self.idle = None
+
+        idle = options.get('idle')
+
+        if idle:
+            self.idle = IdleReaper(self, **idle)
+
+        # Outbound queue, built from the `coalesce` (`True` or
+        # `{'window': seconds, 'size': bytes}`) and `send_queue`
+        # (`pysocketio.buffer.WriteBuffer` limits) options
+        self.buffer_options = None
+
+        coalesce = options.get('coalesce')
+        send_queue = options.get('send_queue')
+
+        if coalesce or send_queue:
+            self.buffer_options = {}
+
+        if coalesce:
+            self.buffer_options['window'] = 0
+
+            if coalesce is not True:
+                self.buffer_options.update(coalesce)
+
+        if send_queue:
+            self.buffer_options.update(send_queue)
+
         self.nsps = {}
+
+        # Namespace lookups, dynamic namespaces and the `strict_namespaces`
+        # allowlist mode (`pysocketio.dynamic`)
+        self.namespaces = Registry(
+            self, options.get('strict_namespaces', False),
+            options.get('max_dynamic_namespaces', 1000)
+        )
+
         self.adapter(options.get('adapter') or Adapter)
         self.sockets = self.of('/')
 
         # Expose main namespace (/)
-        for name in ['on', 'to', 'use', 'emit', 'send']:
+        for name in ['on', 'to', 'use', 'route', 'conflate', 'history', 'emit', 'send']:
             func = getattr(self.sockets, name)
             setattr(self, name, func)
 
@@ -44,18 +154,23 @@ class Engine(Emitter):
         self.sockets.flags['json'] = True
         return self
 
+    @property
+    def local(self):
+        self.sockets.flags['local'] = True
+        return self
+
     def adapter(self, adapter=None):
         """Sets the adapter for rooms.
 
         :param adapter: Replacement adapter to use
-        :type adapter: class of `pysocketio_adapter.Adapter`
+        :type adapter: class of `pysocketio.adapter.Adapter`
         """
         if not adapter:
             return self._adapter
 
         self._adapter = adapter
 
-        for nsp in self.nsps:
+        for nsp in self.nsps.values():
             nsp.adapter = self._adapter(nsp)
 
         return self
@@ -66,19 +181,61 @@ class Engine(Emitter):
         :param socket: EIO Socket
         :type socket: pyengineio.socket.Socket
         """
-        log.debug('incoming connection with sid "%s"', socket.sid)
+        if trace.engine:
+            log.debug('incoming connection with sid "%s"', socket.sid)
+
+        if self.admission is not None:
+            reason = self.admission.admit(socket)
+
+            if reason:
+                return self.admission.reject(socket, reason)
 
         client = Client(self, socket)
-        client.connect('/')
+        client.connect('/', getattr(socket.request, 'query', None))
+
+    def negotiate(self, request):
+        """Retrieves the serializer requested in a handshake query, the
+           default serializer if missing or unknown."""
+        name = serializer.requested(getattr(request, 'query', None))
+
+        return self.serializers.get(name, self.serializer)
+
+    def transcode(self, encoded_packets, target):
+        """Re-encodes packets encoded by the default serializer for the
+           clients of `target`."""
+        if target is self.serializer:
+            return encoded_packets
+
+        transcoder = self.transcoders.get(target)
+
+        if transcoder is None:
+            transcoder = self.transcoders[target] = serializer.Transcoder(self.serializer, target)
+
+        return transcoder.transcode(encoded_packets)
 
     def of(self, name):
         """Looks up a namespace.
 
-        :param name: Namespace name
+        :param name: Namespace name, or the pattern of dynamic namespaces
+                     (`*` glob, compiled regular expression or function)
+                     returning their `pysocketio.dynamic.ParentNamespace`
         :type name: str
         """
-        if not self.nsps.get(name):
-            log.debug('initializing namespace "%s"', name)
-            self.nsps[name] = Namespace(self, name)
+        if is_pattern(name):
+            return self.namespaces.parent(name)
+
+        nsp = self.nsps.get(name)
+
+        if nsp is not None:
+            self.namespaces.claim(nsp)
+            return nsp
+
+        parent = self.namespaces.match(name)
+
+        if parent is not None:
+            return self.namespaces.add(parent, name)
+
+        log.debug('initializing namespace "%s"', name)
 
-        return self.nsps[name]
+        nsp = self.nsps[name] = Namespace(self, name)
+        return nsp
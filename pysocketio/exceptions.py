@@ -0,0 +1,8 @@
+class SocketIOError(Exception):
+    pass
+
+
+class AckTimeoutError(SocketIOError):
+    def __init__(self, ack_id):
+        super(AckTimeoutError, self).__init__('ack %s timed out' % ack_id)
+        self.ack_id = ack_id
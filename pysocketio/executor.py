@@ -0,0 +1,141 @@
+"""Off-loop execution of event handlers.
+
+Routes run inline on the gevent hub by default, CPU-heavy handlers can
+be moved to an executor for a whole namespace, or for a single event:
+
+    nsp.executor = GreenletExecutor(100)
+
+    @nsp.route('thumbnail', executor=ProcessExecutor(4))
+    def thumbnail(image):
+        return render(image)
+
+Greenlet handlers are called with the `Socket` followed by the event
+arguments. Thread and process handlers are only called with the event
+arguments, sockets must not be used outside of the hub.
+
+The value returned by the handler is sent as the ack (a tuple is sent
+as multiple arguments). Events of a socket are handled in order, events
+received while a handler is running are queued behind it.
+"""
+from collections import deque
+import gevent
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Executor(object):
+    #: Handlers are called with the `Socket`
+    socket = True
+
+    def submit(self, func, args, callback):
+        """Runs `func(*args)`.
+
+        :param func: Handler function
+        :type func: function
+
+        :param args: Handler arguments
+        :type args: list
+
+        :param callback: Callback function, called in a new greenlet
+                         with `(exception, result)` once `func` returns
+        :type callback: function
+        """
+        raise NotImplementedError
+
+
+class GreenletExecutor(Executor):
+    def __init__(self, size=100):
+        """Runs handlers in greenlets, at most `size` at a time.
+
+        Suited to handlers waiting on I/O, CPU-bound handlers still
+        block the hub.
+
+        :param size: Maximum concurrent handlers
+        :type size: int
+        """
+        self.size = size
+
+        self.active = 0
+        self.queue = deque()
+
+    def submit(self, func, args, callback):
+        if self.active >= self.size:
+            self.queue.append((func, args, callback))
+            return
+
+        self.start(func, args, callback)
+
+    def start(self, func, args, callback):
+        self.active += 1
+
+        def on_done(greenlet):
+            self.active -= 1
+
+            if greenlet.successful():
+                callback(None, greenlet.value)
+            else:
+                callback(greenlet.exception, None)
+
+            while self.queue and self.active < self.size:
+                self.start(*self.queue.popleft())
+
+        # Linked callbacks run in their own greenlet, not the hub
+        gevent.spawn(func, *args).link(on_done)
+
+
+class ThreadExecutor(Executor):
+    socket = False
+
+    def __init__(self, size=4):
+        """Runs handlers in a thread pool.
+
+        Suited to handlers releasing the GIL (compression, hashing,
+        image libraries...).
+
+        :param size: Number of threads
+        :type size: int
+        """
+        self.size = size
+        self.pool = None
+
+    def submit(self, func, args, callback):
+        if self.pool is None:
+            from gevent.threadpool import ThreadPool
+            self.pool = ThreadPool(self.size)
+
+        def on_done(result):
+            if result.successful():
+                callback(None, result.value)
+            else:
+                callback(result.exception, None)
+
+        # Completion runs handlers queued behind this one, off the hub
+        self.pool.spawn(func, *args).rawlink(lambda result: gevent.spawn(on_done, result))
+
+
+class ProcessExecutor(ThreadExecutor):
+    def __init__(self, size=None):
+        """Runs handlers in a process pool, handlers must be module-level
+           functions and their arguments/results picklable.
+
+        Processes are forked on first use.
+
+        :param size: Number of processes (defaults to the CPU count)
+        :type size: int
+        """
+        if size is None:
+            import multiprocessing
+            size = multiprocessing.cpu_count()
+
+        super(ProcessExecutor, self).__init__(size)
+
+        self.processes = None
+
+    def submit(self, func, args, callback):
+        if self.processes is None:
+            import multiprocessing
+            self.processes = multiprocessing.Pool(self.size)
+
+        # Each thread waits on a process, leaving the hub free
+        super(ProcessExecutor, self).submit(self.processes.apply, (func, tuple(args)), callback)
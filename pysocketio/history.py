@@ -0,0 +1,61 @@
+"""Room message history.
+
+Enabled per room with `Namespace.history(room, size)`, the adapter then
+keeps the last `size` encoded packets broadcast to the room:
+
+    io.history('lobby', 100)
+
+    # Replays the packets broadcast after offset 42
+    socket.join('lobby', since=42)
+
+Offsets increase by one for each packet broadcast to the room, the first
+packet is given offset 0 (`RoomHistory.offset` is the offset of the next
+packet). Volatile packets aren't kept. Histories are local to the
+process, each node of a cluster numbers the packets it delivers.
+"""
+from collections import deque
+from itertools import islice
+
+
+class RoomHistory(object):
+    __slots__ = ('entries', 'offset')
+
+    def __init__(self, size):
+        """Fixed-capacity ring buffer of encoded packets.
+
+        :param size: Number of packets kept
+        :type size: int
+        """
+        self.entries = deque(maxlen=size)
+
+        # Offset of the next packet
+        self.offset = 0
+
+    @property
+    def first(self):
+        """Offset of the oldest packet kept."""
+        return self.offset - len(self.entries)
+
+    def append(self, encoded_packets):
+        """Records the encoded packets of a broadcast.
+
+        :return: Offset of the packet
+        :rtype: int
+        """
+        self.entries.append(encoded_packets)
+        self.offset += 1
+
+        return self.offset - 1
+
+    def since(self, offset):
+        """Retrieves the encoded packets broadcast after `offset`, starting
+           with the oldest packet kept if some were already discarded.
+
+        :param offset: Offset of the last packet received (-1 for all)
+        :type offset: int
+
+        :rtype: list
+        """
+        start = max(offset + 1 - self.first, 0)
+
+        return list(islice(self.entries, start, None))
@@ -0,0 +1,128 @@
+"""Idle connection reaper.
+
+Enabled with the engine `idle` option:
+
+    Engine({'idle': {
+        'timeout': 300,         # seconds without traffic
+        'disconnect': 3600      # optional, hard limit
+    }})
+
+Clients without traffic, inbound or outbound, for `timeout` seconds
+release their per-connection state (the decoder and its parser, empty
+ack tables, event rate buckets), rebuilt lazily by the next packet.
+Clients idle past `disconnect` seconds are disconnected, clients only
+receiving packets (e.g. feed subscribers) aren't idle.
+
+Inbound data is timestamped, outbound writes only set a flag noticed
+by the next check.
+
+Each client has at most one pending check on the engine timer wheel,
+dormant clients without a `disconnect` limit have none until their
+next packet.
+"""
+from pysocketio.metrics import clock
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class IdleReaper(object):
+    def __init__(self, engine, timeout=300.0, disconnect=None):
+        """Releases the state of idle clients.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param timeout: Seconds without traffic before releasing state
+        :type timeout: float
+
+        :param disconnect: Seconds without traffic before disconnecting
+        :type disconnect: float
+        """
+        self.engine = engine
+
+        self.timeout = timeout
+        self.disconnect = disconnect
+
+        # Earliest check
+        self.delay = min(timeout, disconnect) if disconnect else timeout
+
+    def watch(self, client, delay=None):
+        """Schedules the next idle check of a client."""
+        client.reaper = self.engine.timer.schedule(delay or self.delay, self.check, client)
+
+    def check(self, client):
+        client.reaper = None
+
+        if client.conn.ready_state != 'open':
+            return
+
+        now = clock()
+
+        if client.sent:
+            # Written to since the previous check
+            client.sent = False
+            client.active = now
+
+        idle = now - client.active
+
+        if self.disconnect and idle >= self.disconnect:
+            log.debug('disconnecting %s, idle for %.0f seconds', client.sid, idle)
+
+            if self.engine.metrics is not None:
+                self.engine.metrics.inc('idle_disconnected')
+
+            return client.disconnect()
+
+        if idle < self.timeout:
+            return self.watch(client, self.delay - idle)
+
+        if not self.release(client):
+            # Waiting on attachments, checked again later
+            return self.watch(client, self.delay)
+
+        if self.disconnect:
+            self.watch(client, self.disconnect - idle)
+
+    def release(self, client):
+        """Releases the per-connection state of an idle client.
+
+        :return: `False` if a packet is partially received
+        :rtype: bool
+        """
+        decoder = client._decoder
+        released = decoder is not None
+
+        if decoder is not None:
+            if decoder.pending:
+                return False
+
+            decoder.off('decoded')\
+                   .off('rejected')
+
+            decoder.destroy()
+            client._decoder = None
+
+        client._received = None
+
+        for socket in client.sockets:
+            if socket.acks is not None and not socket.acks:
+                socket.acks = None
+                released = True
+
+            if socket.bucket is not None:
+                socket.bucket = None
+                released = True
+
+        if released and self.engine.metrics is not None:
+            self.engine.metrics.inc('idle_released')
+
+        return True
+
+    def activity(self, client):
+        """Called with each inbound frame of a client."""
+        client.active = clock()
+
+        if client.reaper is None:
+            self.watch(client)
@@ -0,0 +1,238 @@
+from bisect import bisect_left
+from timeit import default_timer as clock
+
+LATENCY_BUCKETS = [
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+]
+
+FANOUT_BUCKETS = [1, 10, 100, 1000, 10000, 100000]
+
+#: name -> (type, label names, help)
+DEFINITIONS = {
+    'packets_in': ('counter', ('namespace', 'type'), 'Decoded packets received'),
+    'packets_out': ('counter', (), 'Packets written to transports'),
+    'bytes_in': ('counter', (), 'Bytes received from transports'),
+    'bytes_out': ('counter', (), 'Bytes written to transports'),
+    'encode_seconds': ('histogram', (), 'Packet encode time'),
+    'decode_seconds': ('histogram', (), 'Packet decode time'),
+    'handler_seconds': ('histogram', ('namespace', 'event'), 'Event handler execution time'),
+    'broadcast_fanout': ('histogram', ('namespace',), 'Recipients per broadcast'),
+    'packets_rejected': ('counter', ('reason',), 'Inbound packets rejected by the decoder'),
+    'admission_rejected': ('counter', ('reason',), 'Connections, namespaces and events rejected'),
+    'sessions_saved': ('counter', (), 'Disconnected sessions kept for recovery'),
+    'sessions_restored': ('counter', (), 'Sessions recovered by reconnecting clients'),
+    'idle_released': ('counter', (), 'Idle clients whose per-connection state was released'),
+    'idle_disconnected': ('counter', (), 'Clients disconnected after the idle limit'),
+    'sockets_connected': ('gauge', ('namespace',), 'Connected sockets')
+}
+
+#: Event label used once a namespace reaches `max_events` distinct events
+OTHER_EVENTS = '_other'
+
+#: Namespace label of packets for namespaces that don't exist
+UNKNOWN_NAMESPACE = 'unknown'
+
+TEXT_TYPES = (str, type(u''))
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        result = {'count': self.count, 'sum': self.sum, 'buckets': {}}
+        total = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result['buckets'][bound] = total
+
+        return result
+
+
+class Metrics(object):
+    def __init__(self, engine, max_events=256):
+        """Metrics registry, enabled with `Engine({'metrics': True})`.
+
+        Call sites check `engine.metrics is not None` before recording,
+        a disabled registry costs a single attribute lookup.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param max_events: Distinct event labels tracked per namespace
+        :type max_events: int
+        """
+        self.engine = engine
+        self.max_events = max_events
+
+        self.counters = {}
+        self.histograms = {}
+
+        self.events = {}
+
+    def inc(self, name, labels=(), value=1):
+        """Increments a counter.
+
+        :param name: Metric name
+        :type name: str
+
+        :param labels: Label values
+        :type labels: tuple
+
+        :param value: Increment
+        :type value: int
+        """
+        series = self.counters.get(name)
+
+        if series is None:
+            series = self.counters[name] = {}
+
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """Records a histogram observation.
+
+        :param name: Metric name
+        :type name: str
+
+        :param value: Observed value
+        :type value: float
+
+        :param labels: Label values
+        :type labels: tuple
+        """
+        series = self.histograms.get(name)
+
+        if series is None:
+            series = self.histograms[name] = {}
+
+        histogram = series.get(labels)
+
+        if histogram is None:
+            buckets = FANOUT_BUCKETS if name == 'broadcast_fanout' else LATENCY_BUCKETS
+            histogram = series[labels] = Histogram(buckets)
+
+        histogram.observe(value)
+
+    def event(self, nsp, name):
+        """Retrieves the label for an event, client supplied event names
+           are capped to `max_events` per namespace."""
+        if not isinstance(name, TEXT_TYPES):
+            return OTHER_EVENTS
+
+        events = self.events.get(nsp)
+
+        if events is None:
+            events = self.events[nsp] = set()
+
+        if name in events:
+            return name
+
+        if len(events) >= self.max_events:
+            return OTHER_EVENTS
+
+        events.add(name)
+        return name
+
+    def gauges(self):
+        return {
+            'sockets_connected': dict([
+                ((name,), len(nsp.connected))
+                for name, nsp in self.engine.nsps.items()
+            ])
+        }
+
+    def snapshot(self):
+        """Exports metrics as a dict, `{name: {labels: value}}` where
+           labels is a `{label: value}` dict frozen into a sorted tuple."""
+        result = {}
+
+        for name, series in self.counters.items():
+            result[name] = self._series(name, series)
+
+        for name, series in self.gauges().items():
+            result[name] = self._series(name, series)
+
+        for name, series in self.histograms.items():
+            result[name] = self._series(name, dict([
+                (labels, histogram.snapshot())
+                for labels, histogram in series.items()
+            ]))
+
+        return result
+
+    def _series(self, name, series):
+        names = DEFINITIONS[name][1]
+
+        return dict([
+            (tuple(sorted(zip(names, labels))), value)
+            for labels, value in series.items()
+        ])
+
+    def prometheus(self, prefix='socketio'):
+        """Exports metrics in the Prometheus text format."""
+        lines = []
+
+        def header(name, kind, family=None):
+            # Family names match their samples (`_total` counters)
+            family = family or name
+
+            lines.append('# HELP %s_%s %s' % (prefix, family, DEFINITIONS[name][2]))
+            lines.append('# TYPE %s_%s %s' % (prefix, family, kind))
+
+        for name, series in sorted(self.counters.items()):
+            header(name, 'counter', name + '_total')
+
+            for labels, value in sorted(series.items()):
+                lines.append('%s_%s_total%s %s' % (prefix, name, self._labels(name, labels), value))
+
+        for name, series in sorted(self.gauges().items()):
+            header(name, 'gauge')
+
+            for labels, value in sorted(series.items()):
+                lines.append('%s_%s%s %s' % (prefix, name, self._labels(name, labels), value))
+
+        for name, series in sorted(self.histograms.items()):
+            header(name, 'histogram')
+
+            for labels, histogram in sorted(series.items()):
+                total = 0
+
+                for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    total += count
+                    lines.append('%s_%s_bucket%s %s' % (
+                        prefix, name, self._labels(name, labels, ('le', bound)), total
+                    ))
+
+                lines.append('%s_%s_sum%s %s' % (prefix, name, self._labels(name, labels), histogram.sum))
+                lines.append('%s_%s_count%s %s' % (prefix, name, self._labels(name, labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def _labels(self, name, labels, extra=None):
+        pairs = list(zip(DEFINITIONS[name][1], labels))
+
+        if extra:
+            pairs.append(extra)
+
+        if not pairs:
+            return ''
+
+        return '{%s}' % ','.join([
+            '%s="%s"' % (key, ('%s' % (value,)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in pairs
+        ])
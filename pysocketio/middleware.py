@@ -0,0 +1,222 @@
+"""Namespace middleware.
+
+Middleware is called with each connecting `Socket` and returns an error
+to reject the connection (anything falsy accepts it).
+
+Blocking work (token services, databases...) is moved off the connect
+path by returning a greenlet or an `AsyncResult`, its value is then
+used as the error, connections keep being accepted meanwhile:
+
+    def authorize(socket):
+        return gevent.spawn(check_token, socket.request)
+
+    def authorize(socket):
+        result = AsyncResult()
+        service.validate(socket.request, callback=result.set)  # next(err)
+
+        return result
+
+    engine.use(authorize, timeout=5, cache=30, key=token_of, concurrency=100)
+"""
+from collections import deque, OrderedDict
+import gevent
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+#: Returned by `Middleware.__call__` when `callback` will be called later
+PENDING = object()
+
+ERROR = 'middleware error'
+TIMEOUT = 'middleware timeout'
+CLOSED = 'client closed'
+
+
+def is_pending(result):
+    """Checks if a middleware result is a greenlet/`AsyncResult`."""
+    return hasattr(result, 'rawlink')
+
+
+class Middleware(object):
+    def __init__(self, engine, func, timeout=None, cache=None, key=None,
+                 concurrency=None, cache_size=1024):
+        """Wraps a middleware function.
+
+        :param engine: Engine (timeouts use the engine timer)
+        :type engine: pysocketio.engine.Engine
+
+        :param func: Middleware function, called with the `Socket`
+        :type func: function
+
+        :param timeout: Seconds before a pending result is rejected
+        :type timeout: float
+
+        :param cache: Seconds results are reused for sockets with the same `key`
+        :type cache: float
+
+        :param key: Cache key function, called with the `Socket`
+                    (`None` keys aren't cached)
+        :type key: function
+
+        :param concurrency: Maximum pending results, further sockets are queued
+        :type concurrency: int
+
+        :param cache_size: Maximum cached results
+        :type cache_size: int
+        """
+        self.engine = engine
+        self.func = func
+
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        self.cache = cache
+        self.cache_size = cache_size
+        self.key = key
+
+        # key -> (expires, error)
+        self.results = OrderedDict()
+
+        # key -> callbacks waiting on the pending result
+        self.waiting = {}
+
+        self.active = 0
+        self.queue = deque()
+
+    def __call__(self, socket, callback):
+        """Runs the middleware for `socket`.
+
+        :return: Error, or `PENDING` if `callback` will be called with the error
+        """
+        key = None
+
+        if self.cache and self.key is not None:
+            key = self.key(socket)
+
+        if self.concurrency and self.active >= self.concurrency and not self.cached(key):
+            self.queue.append((socket, key, callback))
+            return PENDING
+
+        return self.dispatch(socket, key, callback)
+
+    def cached(self, key):
+        return key is not None and (key in self.waiting or self.lookup(key) is not None)
+
+    def lookup(self, key):
+        """Retrieves a cached `(expires, error)` result."""
+        result = self.results.get(key)
+
+        if result is None:
+            return None
+
+        if result[0] < time.time():
+            del self.results[key]
+            return None
+
+        return result
+
+    def store(self, key, error):
+        if key is None:
+            return
+
+        self.results.pop(key, None)
+        self.results[key] = (time.time() + self.cache, error)
+
+        while len(self.results) > self.cache_size:
+            self.results.popitem(last=False)
+
+    def dispatch(self, socket, key, callback):
+        if key is not None:
+            result = self.lookup(key)
+
+            if result is not None:
+                return result[1]
+
+            # Share the pending result of an identical socket
+            if key in self.waiting:
+                self.waiting[key].append(callback)
+                return PENDING
+
+        try:
+            result = self.func(socket)
+        except Exception as ex:
+            log.warn('error in middleware %r: %s', self.func, ex, exc_info=True)
+            return ERROR
+
+        if not is_pending(result):
+            self.store(key, result)
+            return result
+
+        self.start(result, key, callback)
+        return PENDING
+
+    def start(self, result, key, callback):
+        self.active += 1
+
+        if key is not None:
+            self.waiting[key] = [callback]
+
+        state = {'done': False, 'timer': None}
+
+        def finish(error, cache=True):
+            if state['done']:
+                return
+
+            state['done'] = True
+
+            if state['timer'] is not None:
+                state['timer'].cancel()
+
+            self.active -= 1
+
+            callbacks = [callback]
+
+            if key is not None:
+                callbacks = self.waiting.pop(key, callbacks)
+
+                if cache:
+                    self.store(key, error)
+
+            for func in callbacks:
+                func(error)
+
+            self.release()
+
+        def on_result(source):
+            if source.successful():
+                return finish(source.value)
+
+            log.warn('error in middleware %r: %s', self.func, source.exception)
+            finish(ERROR, False)
+
+        def on_timeout():
+            log.debug('middleware %r timed out', self.func)
+
+            kill = getattr(result, 'kill', None)
+
+            if kill is not None:
+                kill(block=False)
+
+            finish(TIMEOUT, False)
+
+        # Continuations (next middleware, connection handlers) run user
+        # code, spawned off the hub and the timer greenlet
+        if self.timeout:
+            state['timer'] = self.engine.timer.schedule(self.timeout, gevent.spawn, on_timeout)
+
+        result.rawlink(lambda source: gevent.spawn(on_result, source))
+
+    def release(self):
+        """Runs queued sockets while under the concurrency limit."""
+        while self.queue and self.active < self.concurrency:
+            socket, key, callback = self.queue.popleft()
+
+            if socket.client.conn.ready_state != 'open':
+                callback(CLOSED)
+                continue
+
+            error = self.dispatch(socket, key, callback)
+
+            if error is not PENDING:
+                callback(error)
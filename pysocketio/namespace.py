@@ -1,4 +1,7 @@
+from pysocketio.binary import has_binary
+from pysocketio.middleware import Middleware, PENDING
 from pysocketio.socket import Socket
+from pysocketio import trace
 import pysocketio_parser as parser
 
 from pyemitter import Emitter
@@ -22,34 +25,156 @@ class Namespace(Emitter):
         self.engine = engine
         self.name = name
 
+        # Parent of dynamic namespaces (`pysocketio.dynamic.ParentNamespace`)
+        self.parent = None
+
         self.sockets = []
         self.connected = {}
 
+        # Sessions of disconnected sockets (`pysocketio.recovery`), by sid
+        self.ghosts = {}
+
         self.middleware = []
+        self.routes = {}
+
+        # Route executors (`pysocketio.executor`), inline when `None`
+        self.executor = None
+        self.executors = {}
         self.adapter = self.engine.adapter()(self)
 
-        self.rooms = []
+        self.rooms = set()
         self.flags = {}
 
+    @property
+    def empty(self):
+        """No sockets are connected, or recoverable, and no room history
+           is kept."""
+        return not self.sockets and not self.ghosts and not self.adapter.histories
+
     @property
     def json(self):
         self.flags['json'] = True
         return self
 
-    def use(self, func):
-        """Sets up namespace middleware."""
-        self.middleware.append(func)
+    @property
+    def local(self):
+        """Restricts the next broadcast to sockets on this node."""
+        self.flags['local'] = True
         return self
 
-    def run(self, socket):
-        """Executes the middleware for an incoming client."""
-        for func in self.middleware:
-            error = func(socket)
+    def use(self, func, **options):
+        """Sets up namespace middleware.
 
-            if error:
-                return error
+        :param func: Middleware function, called with each `Socket`, returns
+                     an error (or a greenlet/`AsyncResult` producing one)
+        :type func: function
+
+        :param options: `pysocketio.middleware.Middleware` options
+                        (`timeout`, `cache`, `key`, `concurrency`)
+        :type options: dict
+        """
+        self.middleware.append(Middleware(self.engine, func, **options))
+        return self
+
+    def route(self, event, func=None, executor=None):
+        """Registers the handler of an event, for every socket.
+
+        Handlers are called with the `Socket` followed by the event
+        arguments, routed events aren't emitted on the socket:
+
+            @nsp.route('message')
+            def on_message(socket, message):
+                pass
+
+        :param event: Event name
+        :type event: str
+
+        :param func: Handler function
+        :type func: function
+
+        :param executor: Executor running the handler (defaults to the
+                         namespace `executor`)
+        :type executor: pysocketio.executor.Executor
+        """
+        def register(func):
+            self.routes[event] = func
+
+            if executor is not None:
+                self.executors[event] = executor
+
+            return func
+
+        if func is None:
+            return register
+
+        register(func)
+        return self
+
+    def run(self, socket, callback):
+        """Executes the middleware for an incoming client.
+
+        Middleware runs in order, `callback` is called with the first
+        error (or `None`), synchronously unless a middleware is pending.
+
+        :param socket: Socket
+        :type socket: pysocketio.socket.Socket
+
+        :param callback: Callback function
+        :type callback: function
+        """
+        middleware = self.middleware
+        position = [0]
+
+        def step(error=None):
+            while not error and position[0] < len(middleware):
+                func = middleware[position[0]]
+                position[0] += 1
+
+                error = func(socket, step)
+
+                if error is PENDING:
+                    return
+
+            callback(error)
+
+        step()
+
+    def conflate(self, key=None):
+        """Only sends each client the latest pending packet of the
+           next broadcast's event (and `key`).
 
-        return None
+        :param key: Conflation key (e.g. an entity id)
+        :type key: hashable
+        """
+        self.flags['conflate'] = (key,)
+        return self
+
+    def history(self, room, size=100):
+        """Keeps the last `size` packets broadcast to a room, replayed to
+           sockets joining with `since` (`pysocketio.history`).
+
+        :param room: Room name
+        :type room: str
+
+        :param size: Number of packets kept (`0` to stop)
+        :type size: int
+        """
+        self.adapter.keep_history(room, size)
+        return self
+
+    def offset(self, room):
+        """Retrieves the offset of the next packet broadcast to a room,
+           `None` without history.
+
+        :param room: Room name
+        :type room: str
+        """
+        history = self.adapter.histories.get(room)
+
+        if history is None:
+            return None
+
+        return history.offset
 
     def to(self, name):
         """Targets a room when emitting.
@@ -57,12 +182,10 @@ class Namespace(Emitter):
         :param name: Room name
         :type name: str
         """
-        if name not in self.rooms:
-            self.rooms.append(name)
-
+        self.rooms.add(name)
         return self
 
-    def add(self, client, on_connected=None):
+    def add(self, client, on_connected=None, pid=None):
         """Adds a new client.
 
         :param client: Client
@@ -70,20 +193,62 @@ class Namespace(Emitter):
 
         :param on_connected: Connected callback
         :type on_connected: function
+
+        :param pid: Private session id of a disconnected socket to recover
+        :type pid: str
         """
-        log.debug('adding socket to nsp "%s"', self.name)
+        if trace.namespace:
+            log.debug('adding socket to nsp "%s"', self.name)
 
         socket = Socket(self, client)
+        session = None
+
+        recovery = self.engine.recovery
+
+        if recovery is not None:
+            session = recovery.restore(self, pid) if pid else None
+
+            if session is not None:
+                # Restored in place, with the previous socket id and rooms
+                socket.sid = session.sid
+                socket.pid = session.pid
+            else:
+                socket.pid = recovery.session_id()
+
+        if not self.middleware:
+            return self.on_run(socket, None, on_connected, session)
+
+        def on_run(error):
+            self.on_run(socket, error, on_connected, session)
 
         # Execute middleware
-        error = self.run(socket)
+        self.run(socket, on_run)
 
-        if client.conn.ready_state != 'open':
-            log.debug('next called after client was closed - ignoring socket')
-            return None
+    def on_run(self, socket, error, on_connected=None, session=None):
+        """Called once the middleware has been executed.
+
+        :param socket: Socket
+        :type socket: pysocketio.socket.Socket
+
+        :param error: Middleware error
+        :type error: object
+
+        :param on_connected: Connected callback
+        :type on_connected: function
+
+        :param session: Recovered session (`pysocketio.recovery.Session`)
+        :type session: pysocketio.recovery.Session
+        """
+        if socket.client.conn.ready_state != 'open' or error:
+            if session is not None:
+                # Recovery refused, drop the rooms kept for the session
+                self.adapter.remove_all(session.sid)
+
+            if error:
+                socket.error(error)
+            else:
+                log.debug('next called after client was closed - ignoring socket')
 
-        if error:
-            socket.error(error)
             return None
 
         # track socket
@@ -93,7 +258,7 @@ class Namespace(Emitter):
         # fires before user-set events to prevent state order
         # violations (such as a disconnection before the connection
         # logic is complete)
-        socket.on_connect()
+        socket.on_connect(session)
 
         if on_connected:
             on_connected(socket)
@@ -102,6 +267,10 @@ class Namespace(Emitter):
         self._emit('connect', socket)
         self._emit('connection', socket)
 
+        if self.parent is not None:
+            self.parent._emit('connect', socket)
+            self.parent._emit('connection', socket)
+
         return socket
 
     def remove(self, socket):
@@ -118,12 +287,19 @@ class Namespace(Emitter):
 
     def emit(self, *args):
         """Emits to all clients."""
+        if args and callable(args[-1]):
+            raise ValueError('Callbacks are not supported when broadcasting')
+
         packet = {
-            'type': parser.EVENT,  # TODO BINARY_EVENT
+            'type': parser.BINARY_EVENT if has_binary(args) else parser.EVENT,
             'data': args
         }
 
-        # TODO ACK callback check
+        if trace.sampler is not None:
+            trace.start(packet, 'outbound', 'emit', args[0] if args else None)
+
+        if 'conflate' in self.flags:
+            self.flags['conflate'] = (self.name, args[0] if args else None) + self.flags['conflate']
 
         self.adapter.broadcast(packet, {
             'rooms': self.rooms,
@@ -131,7 +307,7 @@ class Namespace(Emitter):
         })
 
         # Reset options
-        self.rooms = []
+        self.rooms = set()
         self.flags = {}
 
         return self
@@ -0,0 +1,584 @@
+"""Pre-fork server mode.
+
+The master binds the listener once and forks a worker per core, each
+worker serves its own copy of the `Engine`. Workers accept connections
+from the shared listener and forward engine.io polling requests for
+sessions owned by a sibling to that worker's private unix socket, so
+long-polling sessions stay on the process that created them.
+
+Websocket upgrades for a session owned by another worker are handed to
+that worker at accept time: the request head is peeked (not consumed)
+and the connection file descriptor passed over the owner's handoff
+socket (`SCM_RIGHTS`), the owner then serves the upgrade directly.
+Without descriptor passing (python 2, TLS listeners) these upgrades are
+refused, the client keeps using the polling transport.
+"""
+from pysocketio.server import Server
+
+from array import array
+from gevent import socket
+from gevent.server import StreamServer
+import errno
+import gevent
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import tempfile
+import time
+
+try:
+    import httplib
+    from urlparse import parse_qs
+except ImportError:
+    import http.client as httplib
+    from urllib.parse import parse_qs
+
+log = logging.getLogger(__name__)
+
+HOP_BY_HOP = [
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+]
+
+SID_PATTERN = re.compile(r'^[\w\-]+$')
+
+#: Descriptor passing is available
+HANDOFF = hasattr(socket.socket, 'sendmsg') and hasattr(socket, 'SCM_RIGHTS')
+
+#: Request line and headers of websocket upgrades, read when accepted
+REQUEST_LINE = re.compile(br'^GET (\S+) HTTP/1\.\d\r\n')
+UPGRADE_HEADER = re.compile(br'\r\nupgrade:\s*websocket\s*\r\n', re.IGNORECASE)
+
+#: Bytes and seconds spent waiting for the request head when accepting
+PEEK_SIZE = 8192
+PEEK_TIMEOUT = 1.0
+
+
+def handoff_path(socket_path):
+    """Path of the handoff socket of the worker listening on `socket_path`."""
+    return socket_path + '.handoff'
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+class StickyRouter(object):
+    def __init__(self, engine, run_dir, socket_path):
+        """Routes engine.io requests to the worker owning the session.
+
+        Session ownership is published as `<run_dir>/sids/<sid>` links
+        to the owning worker's unix socket.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param run_dir: Directory shared by the workers
+        :type run_dir: str
+
+        :param socket_path: Unix socket path of this worker
+        :type socket_path: str
+        """
+        self.path = engine.options['path']
+        self.sids_dir = os.path.join(run_dir, 'sids')
+        self.socket_path = socket_path
+
+        self.owned = set()
+
+        # Serves connections handed off by siblings, see `accept()`
+        self.handle = None
+        self.handoff = None
+
+        engine.eio.on('connection', self.on_connection)
+
+    def on_connection(self, conn):
+        sid = conn.sid
+
+        self.owned.add(sid)
+
+        try:
+            os.symlink(self.socket_path, os.path.join(self.sids_dir, sid))
+        except OSError as ex:
+            log.warn('unable to publish owner of session %s: %s', sid, ex)
+
+        conn.on('close', lambda *args: self.release(sid))
+
+    def release(self, sid):
+        if sid not in self.owned:
+            return
+
+        self.owned.remove(sid)
+
+        try:
+            os.unlink(os.path.join(self.sids_dir, sid))
+        except OSError:
+            pass
+
+    def release_all(self):
+        for sid in list(self.owned):
+            self.release(sid)
+
+    @staticmethod
+    def sweep(run_dir, socket_path):
+        """Removes the session links of a worker which exited without
+           releasing them (e.g. crashed or killed), and its socket."""
+        sids_dir = os.path.join(run_dir, 'sids')
+
+        try:
+            sids = os.listdir(sids_dir)
+        except OSError:
+            return
+
+        for sid in sids:
+            path = os.path.join(sids_dir, sid)
+
+            try:
+                if os.readlink(path) == socket_path:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+        for path in [socket_path, handoff_path(socket_path)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def owner(self, sid):
+        """Retrieves the unix socket path of the worker owning `sid`."""
+        if not SID_PATTERN.match(sid):
+            return None
+
+        try:
+            return os.readlink(os.path.join(self.sids_dir, sid))
+        except OSError:
+            return None
+
+    def accept(self, handle):
+        """Wraps the connection handler of the public server, websocket
+           upgrades for sessions owned by a sibling are handed to it
+           before the request is read."""
+        self.handle = handle
+
+        def on_accept(sock, address):
+            target = self.upgrade_target(sock)
+
+            if target is not None and self.send(target, sock, address):
+                # The owner serves the connection, only our copy is closed
+                return
+
+            handle(sock, address)
+
+        return on_accept
+
+    def listen(self):
+        """Starts receiving connections handed off by siblings."""
+        path = handoff_path(self.socket_path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(128)
+
+        self.handoff = StreamServer(listener, self.receive)
+        self.handoff.start()
+
+    def close(self):
+        if self.handoff is not None:
+            self.handoff.stop()
+            self.handoff = None
+
+        path = handoff_path(self.socket_path)
+
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def upgrade_target(self, sock):
+        """Peeks at the request head, retrieves the socket path of the
+           sibling owning the session of a websocket upgrade."""
+        head = self.peek(sock)
+
+        if head is None or not UPGRADE_HEADER.search(head):
+            return None
+
+        match = REQUEST_LINE.match(head)
+
+        if match is None:
+            return None
+
+        path, _, query = match.group(1).decode('latin-1').partition('?')
+
+        if not path.startswith(self.path):
+            return None
+
+        sid = parse_qs(query).get('sid')
+
+        if not sid or sid[0] in self.owned:
+            return None
+
+        return self.owner(sid[0])
+
+    def peek(self, sock):
+        """Reads the request head without consuming it, `None` if
+           incomplete after `PEEK_TIMEOUT`."""
+        deadline = time.time() + PEEK_TIMEOUT
+
+        while True:
+            try:
+                head = sock.recv(PEEK_SIZE, socket.MSG_PEEK)
+            except socket.error:
+                return None
+
+            if not head:
+                return None
+
+            end = head.find(b'\r\n\r\n')
+
+            if end >= 0:
+                return head[:end + 2]
+
+            if len(head) >= PEEK_SIZE or time.time() >= deadline:
+                return None
+
+            # Peeking returns the buffered data at once, wait for more
+            gevent.sleep(0.01)
+
+    def send(self, target, sock, address):
+        """Passes the connection descriptor to the worker listening
+           on `target`."""
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            conn.connect(handoff_path(target))
+            conn.sendmsg(
+                [json.dumps(list(address or ())).encode('utf-8')],
+                [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', [sock.fileno()]))]
+            )
+        except (socket.error, TypeError, ValueError) as ex:
+            log.warn('unable to hand connection to %s: %s', target, ex)
+            return False
+        finally:
+            conn.close()
+
+        return True
+
+    def receive(self, conn, address):
+        """Serves a connection handed off by a sibling."""
+        fds = array('i')
+
+        try:
+            data, ancdata, flags, _ = conn.recvmsg(4096, socket.CMSG_LEN(fds.itemsize))
+        except socket.error as ex:
+            log.debug('unable to receive handed off connection: %s', ex)
+            return
+
+        for level, kind, payload in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+
+        if not fds:
+            return
+
+        client = socket.socket(fileno=fds[0])
+
+        try:
+            self.handle(client, tuple(json.loads(data.decode('utf-8'))))
+        finally:
+            client.close()
+
+    def wrap(self, application):
+        def route(environ, start_response):
+            target = self.target(environ)
+
+            if target is None:
+                return application(environ, start_response)
+
+            if environ.get('HTTP_UPGRADE', '').lower() == 'websocket':
+                # Not handed off when accepted (see `accept()`)
+                start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+                return [b'Session is owned by another worker']
+
+            return self.forward(target, environ, start_response)
+
+        return route
+
+    def target(self, environ):
+        if not environ.get('PATH_INFO', '').startswith(self.path):
+            return None
+
+        sid = parse_qs(environ.get('QUERY_STRING', '')).get('sid')
+
+        if not sid or sid[0] in self.owned:
+            return None
+
+        return self.owner(sid[0])
+
+    def forward(self, target, environ, start_response):
+        """Replays the request on the owning worker and relays the response."""
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else None
+
+        headers = {}
+
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                headers[key[5:].replace('_', '-').title()] = value
+
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+
+        forwarded = [environ.get('HTTP_X_FORWARDED_FOR'), environ.get('REMOTE_ADDR')]
+        headers['X-Forwarded-For'] = ', '.join([x for x in forwarded if x])
+
+        url = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+
+        if environ.get('QUERY_STRING'):
+            url += '?' + environ['QUERY_STRING']
+
+        conn = UnixHTTPConnection(target)
+
+        try:
+            conn.request(environ['REQUEST_METHOD'], url, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (socket.error, httplib.HTTPException) as ex:
+            log.warn('unable to forward request to %s: %s', target, ex)
+
+            start_response('502 Bad Gateway', [('Content-Type', 'text/plain')])
+            return [b'Session owner unavailable']
+        finally:
+            conn.close()
+
+        start_response('%d %s' % (response.status, response.reason), [
+            (key, value) for key, value in response.getheaders()
+            if key.lower() not in HOP_BY_HOP
+        ])
+
+        return [data]
+
+
+class PreforkServer(object):
+    def __init__(self, listener, application, engine, *args, **kwargs):
+        """Pre-fork server, takes the same arguments as `Server`.
+
+        :param listener: Listener address
+        :type listener: tuple
+
+        :param application: WSGI application
+        :type application: function
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param workers: Number of worker processes (defaults to the number of cores)
+        :type workers: int
+
+        :param grace: Seconds a stopping worker may spend finishing requests
+        :type grace: float
+
+        :param run_dir: Directory for worker sockets and session links
+        :type run_dir: str
+        """
+        self.workers = kwargs.pop('workers', None) or multiprocessing.cpu_count()
+        self.grace = kwargs.pop('grace', 10.0)
+        self.run_dir = kwargs.pop('run_dir', None)
+
+        self.listener = listener
+        self.application = application
+        self.engine = engine
+
+        self.args = args
+        self.kwargs = kwargs
+
+        self.socket = None
+        self.pids = {}
+        self.retiring = set()
+
+        self.running = False
+        self.reloading = False
+
+    def bind(self):
+        if hasattr(self.listener, 'accept'):
+            return self.listener
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if hasattr(socket, 'SO_REUSEPORT'):
+            # Allows a replacement master to bind while this one drains
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(self.listener)
+        sock.listen(1024)
+        return sock
+
+    def serve_forever(self):
+        self.socket = self.bind()
+
+        created = self.run_dir is None
+
+        if created:
+            self.run_dir = tempfile.mkdtemp(prefix='pysocketio-')
+
+        if not os.path.exists(os.path.join(self.run_dir, 'sids')):
+            os.makedirs(os.path.join(self.run_dir, 'sids'))
+
+        signal.signal(signal.SIGHUP, self.on_reload)
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+
+        self.running = True
+
+        for x in range(self.workers):
+            self.spawn()
+
+        try:
+            while self.running:
+                if self.reloading:
+                    self.reloading = False
+                    self.reload()
+
+                self.reap()
+                time.sleep(1.0)
+        finally:
+            self.stop()
+
+            if created:
+                shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def on_reload(self, signum, frame):
+        self.reloading = True
+
+    def on_stop(self, signum, frame):
+        self.running = False
+
+    def spawn(self):
+        pid = gevent.fork()
+
+        if pid:
+            log.debug('started worker %s', pid)
+            self.pids[pid] = True
+            return pid
+
+        try:
+            self.run_worker()
+        except Exception:
+            log.exception('worker %s crashed', os.getpid())
+            os._exit(1)
+
+        os._exit(0)
+
+    def reload(self):
+        """Restarts workers one at a time, each replacement is started
+           before the old worker is asked to stop."""
+        log.info('restarting %s worker(s)', len(self.pids))
+
+        for pid in list(self.pids):
+            if pid in self.retiring:
+                continue
+
+            self.spawn()
+            self.retire(pid)
+
+    def retire(self, pid):
+        self.retiring.add(pid)
+
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError as ex:
+            if ex.errno != errno.ESRCH:
+                raise
+
+    def reap(self):
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.ECHILD:
+                    return
+
+                raise
+
+            if not pid:
+                return
+
+            self.pids.pop(pid, None)
+
+            StickyRouter.sweep(self.run_dir, self.socket_path(pid))
+
+            if pid in self.retiring:
+                self.retiring.remove(pid)
+                continue
+
+            log.warn('worker %s exited with status %s', pid, status)
+
+            if self.running:
+                self.spawn()
+
+    def stop(self):
+        for pid in list(self.pids):
+            self.retire(pid)
+
+        deadline = time.time() + self.grace
+
+        while self.pids and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in list(self.pids):
+            os.kill(pid, signal.SIGKILL)
+
+        self.reap()
+
+    def socket_path(self, pid):
+        return os.path.join(self.run_dir, 'worker-%s.sock' % pid)
+
+    def run_worker(self):
+        pid = os.getpid()
+        socket_path = self.socket_path(pid)
+
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        router = StickyRouter(self.engine, self.run_dir, socket_path)
+
+        private = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        private.bind(socket_path)
+        private.listen(1024)
+
+        public = Server(self.socket, self.application, self.engine, *self.args, **self.kwargs)
+        public.application = router.wrap(public.application)
+
+        if HANDOFF and not getattr(public, 'ssl_enabled', False):
+            router.listen()
+            public.set_handle(router.accept(public.handle))
+
+        forwarded = Server(private, self.application, self.engine, *self.args, **self.kwargs)
+        forwarded.start()
+
+        def stop():
+            log.debug('worker %s stopping', pid)
+
+            public.stop(timeout=self.grace)
+            forwarded.stop(timeout=self.grace)
+
+        gevent.signal_handler(signal.SIGTERM, stop)
+
+        try:
+            public.serve_forever()
+        finally:
+            router.close()
+            router.release_all()
+
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
@@ -0,0 +1,192 @@
+"""Connection state recovery.
+
+Enabled with the engine `recovery` option:
+
+    Engine({'recovery': {
+        'duration': 120,        # grace period (seconds)
+        'max_packets': 100      # missed packets kept per session
+    }})
+
+Each socket is given a private session id (`pid`), sent with the
+`CONNECT` packet data as `{"sid": ..., "pid": ...}`. When the transport
+drops, the socket's rooms are kept and the packets broadcast to it are
+buffered for `duration` seconds. A client reconnecting with the `pid`
+(in the handshake query for the main namespace, or the `CONNECT` packet
+data) gets its socket id and rooms back, and the missed packets are
+replayed after the `CONNECT` packet.
+
+Sessions whose buffer overflows can't be replayed completely and are
+discarded, the client then connects as a new socket. Sessions are local
+to the process, they aren't shared through cluster adapters.
+"""
+from collections import OrderedDict
+import logging
+import uuid
+
+log = logging.getLogger(__name__)
+
+#: Close reasons the client may recover from, explicit disconnects aren't
+RECOVERABLE = set([
+    'transport close',
+    'transport error',
+    'ping timeout',
+    'forced close',
+    'forced server close'
+])
+
+
+class Session(object):
+    __slots__ = ('recovery', 'pid', 'sid', 'nsp', 'rooms', 'missed', 'offset', 'timer')
+
+    def __init__(self, recovery, socket):
+        """State kept for a disconnected socket.
+
+        :param socket: Disconnected socket
+        :type socket: pysocketio.socket.Socket
+        """
+        self.recovery = recovery
+
+        self.pid = socket.pid
+        self.sid = socket.sid
+        self.nsp = socket.nsp
+
+        self.rooms = set(socket.rooms)
+
+        # Encoded packets missed, conflated packets replace their
+        # previous pending packet
+        self.missed = OrderedDict()
+        self.offset = 0
+
+        self.timer = None
+
+    def packet(self, packet, encoded=False, volatile=False, conflate=None):
+        """Buffers a packet sent while disconnected, mirrors `Socket.packet`."""
+        if volatile:
+            return
+
+        if not encoded:
+            packet['nsp'] = self.nsp.name
+
+            return self.recovery.engine.encoder.encode(
+                packet, lambda encoded_packets: self.packet(encoded_packets, True, conflate=conflate)
+            )
+
+        if conflate is not None:
+            self.missed.pop(conflate, None)
+            key = conflate
+        else:
+            key = self.offset
+            self.offset += 1
+
+        if len(self.missed) >= self.recovery.max_packets:
+            log.debug('session %s missed too many packets, discarding it', self.sid)
+            return self.recovery.discard(self)
+
+        self.missed[key] = packet
+
+
+class Recovery(object):
+    def __init__(self, engine, duration=120.0, max_packets=100):
+        """Keeps the state of disconnected sockets for reconnecting clients.
+
+        :param engine: Engine
+        :type engine: pysocketio.engine.Engine
+
+        :param duration: Seconds sessions are kept after a disconnection
+        :type duration: float
+
+        :param max_packets: Maximum missed packets buffered per session
+        :type max_packets: int
+        """
+        self.engine = engine
+
+        self.duration = duration
+        self.max_packets = max_packets
+
+        # Disconnected sessions by `pid`
+        self.sessions = {}
+
+    @staticmethod
+    def session_id():
+        return uuid.uuid4().hex
+
+    def save(self, socket, reason):
+        """Keeps the state of a socket closed with `reason`.
+
+        :return: `True` if the session was kept
+        :rtype: bool
+        """
+        if socket.pid is None or reason not in RECOVERABLE:
+            return False
+
+        session = Session(self, socket)
+        session.timer = self.engine.timer.schedule(self.duration, self.discard, session)
+
+        self.sessions[session.pid] = session
+        socket.nsp.ghosts[session.sid] = session
+
+        if self.engine.metrics is not None:
+            self.engine.metrics.inc('sessions_saved')
+
+        return True
+
+    def restore(self, nsp, pid):
+        """Retrieves (and removes) the session of `pid`, if it's still kept.
+
+        :param nsp: Namespace the client is connecting to
+        :type nsp: pysocketio.namespace.Namespace
+
+        :param pid: Private session id presented by the client
+        :type pid: str
+        """
+        session = self.sessions.get(pid)
+
+        if session is None or session.nsp is not nsp:
+            return None
+
+        self.release(session)
+
+        if self.engine.metrics is not None:
+            self.engine.metrics.inc('sessions_restored')
+
+        return session
+
+    def release(self, session):
+        """Stops keeping a session, its rooms are left to the caller."""
+        self.sessions.pop(session.pid, None)
+        session.nsp.ghosts.pop(session.sid, None)
+
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+
+    def discard(self, session):
+        """Drops an expired (or unrecoverable) session and its rooms."""
+        if self.sessions.get(session.pid) is not session:
+            return
+
+        log.debug('discarding session %s', session.sid)
+
+        self.release(session)
+        session.nsp.adapter.remove_all(session.sid)
+
+    def replay(self, socket, session):
+        """Writes the packets missed by a restored socket."""
+        for encoded_packets in session.missed.values():
+            socket.packet(encoded_packets, True)
+
+        session.missed = None
+
+
+def parse_pid(data):
+    """Retrieves the `pid` of `CONNECT` packet data or a handshake query."""
+    if isinstance(data, dict):
+        pid = data.get('pid')
+
+        if isinstance(pid, list):
+            # Parsed query strings
+            pid = pid[0] if pid else None
+
+        return pid
+
+    return None
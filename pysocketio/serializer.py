@@ -0,0 +1,317 @@
+"""Packet serializers.
+
+Selected with the engine `serializer` option (a name, or a list of names):
+
+ - `json` (default): stdlib `json`, through `pysocketio_parser`
+ - `fast`: the fastest installed JSON library (`orjson`, `ujson` or
+   `simplejson`), falling back to the stdlib
+ - `msgpack`: whole packets as MessagePack binary frames, compatible
+   with `socket.io-msgpack-parser` clients
+
+The first JSON serializer is the default, binary serializers are only
+used by clients asking for them in the handshake query:
+
+    Engine({'serializer': ['fast', 'msgpack']})
+
+    io('/', {query: {serializer: 'msgpack'}, parser: msgpackParser})
+
+Every serializer provides a shared, stateless `encoder()` and a
+`decoder()` per client. Packets are encoded once with the default
+serializer (broadcasts, history, recovery), clients of another
+serializer are written the packets re-encoded by a `Transcoder`.
+"""
+from pysocketio.binary import Decoder, Encoder
+import pysocketio_parser as parser
+
+from pyemitter import Emitter
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+TEXT_TYPES = (str, type(u''))
+
+#: Handshake query parameter selecting the serializer of a client
+QUERY_PARAMETER = 'serializer'
+
+
+class Serializer(object):
+    #: Backend name
+    name = None
+
+    #: Packets are binary frames, not understood by standard clients
+    binary = False
+
+    def encoder(self):
+        """Creates an encoder, with an `encode(packet, callback)` method."""
+        raise NotImplementedError
+
+    def decoder(self, max_size=None, max_attachments=None):
+        """Creates a decoder, an `Emitter` with `add(data)` and `destroy()`
+           methods and a `pending` property (partially received packet),
+           emitting `decoded` with each packet, and `rejected`
+           (reason, namespace) with packets over the limits.
+
+        :param max_size: Maximum packet size (bytes)
+        :type max_size: int
+
+        :param max_attachments: Maximum attachments per packet
+        :type max_attachments: int
+        """
+        raise NotImplementedError
+
+
+class JSONSerializer(Serializer):
+    name = 'json'
+
+    def __init__(self, dumps=None, loads=None):
+        """JSON serializer (socket.io protocol string format).
+
+        :param dumps: JSON encoder function (`pysocketio_parser` if `None`)
+        :type dumps: function
+
+        :param loads: JSON decoder function (`pysocketio_parser` if `None`)
+        :type loads: function
+        """
+        self.dumps = dumps
+        self.loads = loads
+
+    def encoder(self):
+        return Encoder(self.dumps)
+
+    def decoder(self, max_size=None, max_attachments=None):
+        return Decoder(self.loads, max_size, max_attachments)
+
+
+class FastJSONSerializer(JSONSerializer):
+    def __init__(self):
+        """JSON serializer using the fastest installed library."""
+        for name in ['orjson', 'ujson', 'simplejson']:
+            try:
+                module = __import__(name)
+            except ImportError:
+                continue
+
+            if name == 'orjson':
+                dumps = lambda obj: module.dumps(obj).decode('utf-8')
+            elif name == 'simplejson':
+                dumps = lambda obj: module.dumps(obj, separators=(',', ':'))
+            else:
+                dumps = module.dumps
+
+            self.name = name
+            super(FastJSONSerializer, self).__init__(dumps, module.loads)
+            return
+
+        log.warn('no accelerated JSON library installed, using the stdlib json module')
+
+        self.name = 'json'
+        super(FastJSONSerializer, self).__init__(
+            lambda obj: json.dumps(obj, separators=(',', ':')), json.loads
+        )
+
+
+class MsgpackSerializer(Serializer):
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        """MessagePack serializer, each packet is a single binary frame
+           (buffers are encoded natively, without attachments)."""
+        import msgpack
+
+        self.msgpack = msgpack
+
+    def encoder(self):
+        return MsgpackEncoder(self.msgpack)
+
+    def decoder(self, max_size=None, max_attachments=None):
+        return MsgpackDecoder(self.msgpack, max_size)
+
+
+class MsgpackEncoder(object):
+    #: Packets are binary frames
+    binary = True
+
+    def __init__(self, msgpack):
+        self.packer = msgpack.Packer(use_bin_type=True)
+
+    def encode(self, packet, callback):
+        result = {
+            'type': packet['type'],
+            'nsp': packet.get('nsp') or '/',
+            'data': packet.get('data')
+        }
+
+        if packet.get('id') is not None:
+            result['id'] = packet['id']
+
+        callback([self.packer.pack(result)])
+
+
+class MsgpackDecoder(Emitter):
+    def __init__(self, msgpack, max_size=None):
+        self.msgpack = msgpack
+        self.max_size = max_size
+
+    #: Packets are single frames
+    pending = False
+
+    def add(self, data):
+        if self.max_size and len(data) > self.max_size:
+            return self.emit('rejected', 'packet too large', '/')
+
+        try:
+            packet = self.decode(data)
+        except Exception as ex:
+            log.debug('invalid packet: %s', ex)
+            return self.emit('rejected', 'invalid packet', '/')
+
+        self.emit('decoded', packet)
+
+    def decode(self, data):
+        if isinstance(data, TEXT_TYPES) and not isinstance(data, bytes):
+            raise ValueError('Expected a binary frame')
+
+        packet = self.msgpack.unpackb(bytes(data), raw=False)
+
+        if not isinstance(packet, dict) or not isinstance(packet.get('type'), int):
+            raise ValueError('Invalid packet')
+
+        if not parser.CONNECT <= packet['type'] <= parser.BINARY_ACK:
+            raise ValueError('Invalid packet type %r' % (packet['type'],))
+
+        packet.setdefault('nsp', '/')
+
+        if not isinstance(packet['nsp'], TEXT_TYPES):
+            raise ValueError('Invalid namespace')
+
+        return packet
+
+    def destroy(self):
+        pass
+
+
+SERIALIZERS = {
+    'json': JSONSerializer,
+    'fast': FastJSONSerializer,
+    'msgpack': MsgpackSerializer
+}
+
+
+def create(option=None):
+    """Builds the serializer for the `serializer` engine option.
+
+    :param option: Serializer name, or instance
+    :type option: str or Serializer
+    """
+    if option is None:
+        return JSONSerializer()
+
+    if isinstance(option, Serializer):
+        return option
+
+    if option not in SERIALIZERS:
+        raise ValueError('Unknown serializer %r' % (option,))
+
+    return SERIALIZERS[option]()
+
+
+def create_all(option=None):
+    """Builds the serializers of the `serializer` engine option.
+
+    :param option: Serializer name or instance, or a list of them
+    :type option: str or Serializer or list
+
+    :return: Default (JSON) serializer, and the serializers clients may
+             select by name
+    :rtype: (Serializer, dict)
+    """
+    if not isinstance(option, (list, tuple)):
+        option = [option]
+
+    serializers = [create(value) for value in option]
+    default = None
+
+    for value in serializers:
+        if not value.binary:
+            default = value
+            break
+
+    if default is None:
+        # Standard clients only understand JSON
+        default = JSONSerializer()
+
+    result = {'json': default}
+
+    for value in serializers:
+        result.setdefault(value.name, value)
+
+    return default, result
+
+
+def requested(query):
+    """Retrieves the serializer name of a handshake query."""
+    if not isinstance(query, dict):
+        return None
+
+    name = query.get(QUERY_PARAMETER)
+
+    if isinstance(name, list):
+        # Parsed query strings
+        name = name[0] if name else None
+
+    return name
+
+
+class Transcoder(object):
+    def __init__(self, source, target):
+        """Re-encodes packets encoded by the `source` serializer for
+           `target` clients, the last result is reused (broadcast frames
+           are written to each recipient in turn).
+
+        :param source: Default serializer
+        :type source: Serializer
+
+        :param target: Client serializer
+        :type target: Serializer
+        """
+        self.decoder = source.decoder()
+        self.decoder.on('decoded', self.on_decoded)
+
+        self.encoder = target.encoder()
+
+        self.packet = None
+
+        self.source = None
+        self.result = None
+
+    def transcode(self, encoded_packets):
+        """Re-encodes the frames of a packet.
+
+        :param encoded_packets: Frames encoded by the source serializer
+        :type encoded_packets: list
+
+        :rtype: list
+        """
+        if encoded_packets is self.source:
+            return self.result
+
+        for frame in encoded_packets:
+            self.decoder.add(frame)
+
+        packet, self.packet = self.packet, None
+
+        if packet is None:
+            raise ValueError('Incomplete packet')
+
+        result = []
+        self.encoder.encode(packet, result.extend)
+
+        self.source = encoded_packets
+        self.result = result
+
+        return result
+
+    def on_decoded(self, packet):
+        self.packet = packet
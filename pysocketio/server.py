@@ -3,7 +3,14 @@ import pyengineio
 
 class Server(pyengineio.Server):
     def __init__(self, listener, application, engine, *args, **kwargs):
+        if engine.deflate is not None:
+            from pysocketio.websocket import DeflateHandler
+            kwargs.setdefault('handler_class', DeflateHandler)
+
         super(Server, self).__init__(
             listener, application, engine.eio,
             *args, **kwargs
         )
+
+        # Read by `pysocketio.websocket.DeflateHandler`
+        self.deflate = engine.deflate
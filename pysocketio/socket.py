@@ -1,13 +1,37 @@
+from pysocketio.binary import has_binary
+from pysocketio.emitter import SlottedEmitter
+from pysocketio.exceptions import AckTimeoutError
+from pysocketio.metrics import clock, TEXT_TYPES
+from pysocketio import trace
 import pysocketio_parser as parser
 
-from pyemitter import Emitter
+from collections import deque
 import logging
 
 log = logging.getLogger(__name__)
 
+#: Ack error sent when an off-loop handler raises
+HANDLER_ERROR = 'handler error'
 
-class Socket(Emitter):
-    _emit = Emitter.emit
+#: Error sent for events dropped behind a running off-loop handler
+TOO_MANY_QUEUED = 'too many queued events'
+
+#: Events emitted by the server, never dispatched from client packets
+RESERVED_EVENTS = set([
+    'connect', 'disconnect', 'error',
+    'backpressure', 'drain', 'drop'
+])
+
+
+class Socket(SlottedEmitter):
+    # `__dict__` is only created once an application sets other attributes
+    __slots__ = (
+        'nsp', 'client', 'request', 'adapter', 'sid', 'rooms', 'acks', 'ids',
+        'connected', 'disconnected', '_rooms', 'flags', 'bucket', 'queued',
+        'pid', 'recovered', '__dict__'
+    )
+
+    _emit = SlottedEmitter.emit
 
     def __init__(self, nsp, client):
         """Interface to a `Client` for a given `Namespace`.
@@ -25,52 +49,115 @@ class Socket(Emitter):
 
         self.sid = client.sid
 
-        self.rooms = []
-        self.acks = {}
+        self.rooms = set()
 
         self.connected = True
         self.disconnected = False
 
-        self._rooms = []
-        self.flags = {}
+        # Created on first use
+        self.acks = None
+        self.ids = 0
+
+        self._rooms = None
+        self.flags = None
+
+        # Inbound event rate (`pysocketio.admission`)
+        self.bucket = None
+
+        # Events received while an off-loop handler is running
+        self.queued = None
+
+        # Private session id (`pysocketio.recovery`), and whether the
+        # socket was restored from a previous connection
+        self.pid = None
+        self.recovered = False
 
     @property
     def json(self):
-        self.flags['json'] = True
-        return self
+        return self._flag('json')
 
     @property
     def volatile(self):
-        self.flags['volatile'] = True
-        return self
+        return self._flag('volatile')
 
     @property
     def broadcast(self):
-        self.flags['broadcast'] = True
+        return self._flag('broadcast')
+
+    def conflate(self, key=None):
+        """Only sends the latest pending packet of the next emit's
+           event (and `key`), superseded packets are discarded while
+           the transport isn't writable.
+
+        :param key: Conflation key (e.g. an entity id)
+        :type key: hashable
+        """
+        return self._flag('conflate', (key,))
+
+    def _flag(self, name, value=True):
+        if self.flags is None:
+            self.flags = {}
+
+        self.flags[name] = value
         return self
 
+    def timeout(self, seconds):
+        """Expires the ack callback of the next emit after `seconds`.
+
+        The callback is then called with an `AckTimeoutError`, and with
+        `None` as its first argument when the client does respond.
+
+        :param seconds: Timeout in seconds
+        :type seconds: float
+        """
+        return self._flag('timeout', seconds)
+
     def emit(self, *args):
-        """Emits to this client."""
+        """Emits to this client, a trailing callable is called
+           with the client acknowledgement."""
+        args = list(args)
+
         packet = {
-            'type': parser.EVENT,  # TODO BINARY_EVENT
+            'type': parser.BINARY_EVENT if has_binary(args) else parser.EVENT,
             'data': args
         }
 
-        # TODO ACK
+        broadcast = self._rooms or (self.flags and self.flags.get('broadcast'))
+        conflate = self.flags.get('conflate') if self.flags else None
+
+        if conflate is not None:
+            conflate = (self.nsp.name, args[0] if args else None) + conflate
+
+        if args and callable(args[-1]):
+            if broadcast:
+                raise ValueError('Callbacks are not supported when broadcasting')
+
+            if conflate is not None:
+                raise ValueError('Callbacks are not supported when conflating')
+
+            packet['id'] = self.add_ack(args.pop())
+
+        if trace.sampler is not None:
+            trace.start(packet, 'outbound', 'emit', args[0] if args else None)
+
+        if broadcast:
+            flags = self.flags or {}
+
+            if conflate is not None:
+                flags['conflate'] = conflate
 
-        if self._rooms or self.flags.get('broadcast'):
             self.adapter.broadcast(packet, {
                 'except': [self.sid],
                 'rooms': self._rooms,
-                'flags': self.flags
+                'flags': flags
             })
         else:
             # Dispatch packet
-            self.packet(packet)
+            self.packet(packet, conflate=conflate)
 
         # Reset options
-        self._rooms = []
-        self.flags = {}
+        self._rooms = None
+        self.flags = None
 
         return self
 
@@ -80,16 +167,17 @@ class Socket(Emitter):
         :param name: Room name
         :type name: str
         """
-        if name not in self._rooms:
-            self._rooms.append(name)
+        if self._rooms is None:
+            self._rooms = set()
 
+        self._rooms.add(name)
         return self
 
     def send(self, *args):
         """Sends a `message` event."""
         return self.emit('message', *args)
 
-    def packet(self, packet, encoded=False, volatile=False):
+    def packet(self, packet, encoded=False, volatile=False, conflate=None):
         """Writes a packet.
 
         :param packet: Packet
@@ -100,6 +188,9 @@ class Socket(Emitter):
 
         :param volatile: Flag indicating the packet is volatile
         :type volatile: bool
+
+        :param conflate: Conflation key
+        :type conflate: tuple
         """
         if not encoded:
             packet['nsp'] = self.nsp.name
@@ -108,9 +199,9 @@ class Socket(Emitter):
         volatile = volatile or (self.flags and self.flags.get('volatile'))
 
         # Send packet to client
-        self.client.packet(packet, encoded, volatile)
+        self.client.packet(packet, encoded, volatile, conflate)
 
-    def join(self, room, callback=None):
+    def join(self, room, callback=None, since=None):
         """Joins a room.
 
         :param room: room name
@@ -118,18 +209,31 @@ class Socket(Emitter):
 
         :param callback: Callback function
         :type callback: function
+
+        :param since: Replays the room history after this offset (-1 for
+                      all the packets kept), see `Namespace.history`
+        :type since: int
         """
-        log.debug('joining room %s', room)
+        if trace.socket:
+            log.debug('joining room %s', room)
 
         if room in self.rooms:
+            if since is not None:
+                self.replay(room, since)
+
             return self
 
         def on_added(error=None):
             if error and callback:
                 return callback(error)
 
-            log.debug('joined room %s', room)
-            self.rooms.append(room)
+            if trace.socket:
+                log.debug('joined room %s', room)
+
+            self.rooms.add(room)
+
+            if since is not None:
+                self.replay(room, since)
 
             if callback:
                 callback()
@@ -137,6 +241,11 @@ class Socket(Emitter):
         self.adapter.add(self.sid, room, on_added)
         return self
 
+    def replay(self, room, since):
+        """Writes the packets broadcast to `room` after `since`, as encoded."""
+        for encoded_packets in self.adapter.history(room, since):
+            self.packet(encoded_packets, True)
+
     def leave(self, room, callback=None):
         """Leaves a room.
 
@@ -146,14 +255,17 @@ class Socket(Emitter):
         :param callback: Callback function
         :type callback: function
         """
-        log.debug('leave room %s', room)
+        if trace.socket:
+            log.debug('leave room %s', room)
 
         def on_removed(error=None):
             if error and callback:
-                callback(error)
+                return callback(error)
+
+            if trace.socket:
+                log.debug('left room %s', room)
 
-            log.debug('left room %s', room)
-            self.rooms.remove(room)
+            self.rooms.discard(room)
 
             if callback:
                 callback()
@@ -164,17 +276,35 @@ class Socket(Emitter):
     def leave_all(self):
         """Leave all rooms."""
         self.adapter.remove_all(self.sid)
+        self.rooms = set()
 
-    def on_connect(self):
+    def on_connect(self, session=None):
         """Called by `Namespace` upon successful middleware
-           execution (ie: authorization)."""
-        log.debug('socket connected - writing packet')
+           execution (ie: authorization).
 
-        self.join(self.sid)
-        self.packet({'type': parser.CONNECT})
+        :param session: Recovered session, its missed packets are replayed
+        :type session: pysocketio.recovery.Session
+        """
+        if trace.socket:
+            log.debug('socket connected - writing packet')
+
+        if session is None:
+            self.join(self.sid)
+        else:
+            # Still joined to the session rooms
+            self.rooms = session.rooms
+            self.recovered = True
+
+        if self.pid is None:
+            self.packet({'type': parser.CONNECT})
+        else:
+            self.packet({'type': parser.CONNECT, 'data': {'sid': self.sid, 'pid': self.pid}})
 
         self.nsp.connected[self.sid] = self
 
+        if session is not None:
+            self.nsp.engine.recovery.replay(self, session)
+
     def on_packet(self, packet):
         """Called with each packet. Called by `Client`.
 
@@ -192,6 +322,9 @@ class Socket(Emitter):
         if p_type == parser.ACK:
             return self.on_ack(packet)
 
+        if p_type == parser.BINARY_ACK:
+            return self.on_ack(packet)
+
         if p_type == parser.DISCONNECT:
             return self.on_disconnect()
 
@@ -204,14 +337,124 @@ class Socket(Emitter):
         :param packet: Packet
         :type packet: dict
         """
+        if self.queued is not None:
+            limit = self.nsp.engine.max_queued_events
+
+            if limit and len(self.queued) >= limit:
+                if trace.socket:
+                    log.debug('dropping event from %s, %d events queued', self.sid, len(self.queued))
+
+                return self.error(TOO_MANY_QUEUED)
+
+            # Preserve ordering behind the running off-loop handler
+            self.queued.append(packet)
+            return
+
         args = packet.get('data') or []
-        log.debug('emitting event %s', args)
 
-        if packet.get('id'):
-            log.debug('attaching ack callback to event')
+        if trace.socket:
+            log.debug('emitting event %s', args)
+
+        sampled = packet.get('trace')
+
+        if sampled is not None:
+            sampled.mark('dispatch', args[0] if args else None)
+
+        event = args[0] if args else None
+
+        if isinstance(event, TEXT_TYPES) and event in RESERVED_EVENTS:
+            if trace.socket:
+                log.debug('ignoring reserved event %r from client', event)
+
+            return
+
+        handler = self.nsp.routes.get(event) if isinstance(event, TEXT_TYPES) else None
+
+        if handler is not None:
+            executor = self.nsp.executors.get(event, self.nsp.executor)
+
+            if executor is not None:
+                return self.execute(executor, handler, event, args, packet.get('id'))
+
+        if packet.get('id') is not None:
+            if trace.socket:
+                log.debug('attaching ack callback to event')
+
             args.append(self.ack(packet['id']))
 
-        self._emit(*args)
+        if handler is not None:
+            # Namespace route, called with the socket in place of the event name
+            args[0] = self
+        else:
+            handler = self._emit
+
+        metrics = self.nsp.engine.metrics
+
+        if metrics is None:
+            return handler(*args)
+
+        started = clock()
+
+        try:
+            handler(*args)
+        finally:
+            metrics.observe('handler_seconds', clock() - started, (
+                self.nsp.name, metrics.event(self.nsp.name, event)
+            ))
+
+    def execute(self, executor, handler, event, args, ack_id=None):
+        """Runs a route handler in `executor`, the handler result is sent
+           as the ack (`{"error": HANDLER_ERROR}` if the handler raised).
+
+        Further events are queued until it returns, up to the engine
+        `max_queued_events`, events beyond are dropped with an `error`
+        packet."""
+        if executor.socket:
+            args[0] = self
+        else:
+            args = args[1:]
+
+        metrics = self.nsp.engine.metrics
+        started = clock() if metrics is not None else None
+
+        def on_executed(exception, result):
+            if metrics is not None:
+                metrics.observe('handler_seconds', clock() - started, (
+                    self.nsp.name, metrics.event(self.nsp.name, event)
+                ))
+
+            if exception is not None:
+                log.warn('error in handler for %r: %s', event, exception)
+
+                if ack_id is not None and self.connected:
+                    self.ack(ack_id)({'error': HANDLER_ERROR})
+            elif ack_id is not None and self.connected:
+                if result is None:
+                    result = ()
+                elif not isinstance(result, tuple):
+                    result = (result,)
+
+                self.ack(ack_id)(*result)
+
+            self.drain()
+
+        self.queued = deque()
+        executor.submit(handler, args, on_executed)
+
+    def drain(self):
+        """Handles the events queued behind an off-loop handler."""
+        queued = self.queued
+        self.queued = None
+
+        if not self.connected:
+            return
+
+        while queued and self.queued is None:
+            self.on_event(queued.popleft())
+
+        if queued:
+            # Another off-loop handler is running
+            self.queued.extend(queued)
 
     def ack(self, id):
         """Produces an ack callback to emit with an event.
@@ -219,23 +462,52 @@ class Socket(Emitter):
         :param id: Packet ID
         :type id: str
         """
-        sent = False
+        sent = []
 
         def ack_callback(*args):
             # Prevent double callbacks
             if sent:
                 return
 
-            log.debug('sending ack %s', args)
+            sent.append(True)
+
+            if trace.socket:
+                log.debug('sending ack %s', args)
 
             self.packet({
                 'id': id,
-                'type': parser.ACK,
+                'type': parser.BINARY_ACK if has_binary(args) else parser.ACK,
                 'data': args
             })
 
         return ack_callback
 
+    def add_ack(self, callback):
+        """Registers an ack callback, returns the allocated packet id.
+
+        Pending acks expire after the `timeout()` flag, or the engine
+        `ack_timeout`, using the engine timer wheel.
+
+        :param callback: Callback function
+        :type callback: function
+        """
+        if self.acks is None:
+            self.acks = {}
+
+        ack_id = self.ids
+        self.ids += 1
+
+        timeout = self.flags.get('timeout') if self.flags else None
+        delay = timeout or self.nsp.engine.ack_timeout
+
+        timer = None
+
+        if delay:
+            timer = self.nsp.engine.timer.schedule(delay, self.on_ack_timeout, ack_id)
+
+        self.acks[ack_id] = (callback, timer, timeout is not None)
+        return ack_id
+
     def on_ack(self, packet):
         """Called upon ack packet.
 
@@ -245,20 +517,63 @@ class Socket(Emitter):
         p_id = packet.get('id')
         p_data = packet.get('data')
 
-        ack_func = self.acks.get(p_id)
+        ack = self.acks.pop(p_id, None) if self.acks else None
 
-        if ack_func is None:
+        if ack is None:
             log.debug('bad ack %s', p_id)
             return
 
-        log.debug('calling ack %s with %s', p_id, p_data)
+        callback, timer, errback = ack
+
+        if timer is not None:
+            timer.cancel()
+
+        if trace.socket:
+            log.debug('calling ack %s with %s', p_id, p_data)
+
+        args = list(p_data or [])
+
+        if errback:
+            args.insert(0, None)
+
+        try:
+            callback(*args)
+        except Exception as ex:
+            log.warn('error while calling ack callback: %s', ex)
+
+    def on_ack_timeout(self, ack_id):
+        """Called by the engine timer when an ack expires.
+
+        :param ack_id: Packet ID
+        :type ack_id: int
+        """
+        ack = self.acks.pop(ack_id, None) if self.acks else None
+
+        if ack is None:
+            return
+
+        log.debug('ack %s timed out', ack_id)
+
+        callback, timer, errback = ack
+
+        if not errback:
+            return
 
         try:
-            ack_func(*p_data)
-        except Exception, ex:
+            callback(AckTimeoutError(ack_id))
+        except Exception as ex:
             log.warn('error while calling ack callback: %s', ex)
 
-        del self.acks[p_id]
+    def clear_acks(self):
+        """Discards pending acks."""
+        if not self.acks:
+            return
+
+        for callback, timer, errback in self.acks.values():
+            if timer is not None:
+                timer.cancel()
+
+        self.acks = None
 
     def on_disconnect(self):
         """Called upon client disconnect packet."""
@@ -276,7 +591,13 @@ class Socket(Emitter):
 
         log.debug('closing socket - reason %s', reason)
 
-        self.leave_all()
+        recovery = self.nsp.engine.recovery
+
+        # Recoverable sockets keep their rooms for the grace period
+        if recovery is None or not recovery.save(self, reason):
+            self.leave_all()
+
+        self.clear_acks()
 
         self.nsp.remove(self)
         self.client.remove(self)
@@ -285,7 +606,16 @@ class Socket(Emitter):
         self.disconnected = True
 
         del self.nsp.connected[self.sid]
-        self.emit('disconnect', reason)
+
+        handler = self.nsp.routes.get('disconnect')
+
+        if handler is not None:
+            try:
+                handler(self, reason)
+            except Exception as ex:
+                log.warn('error in disconnect handler: %s', ex, exc_info=True)
+
+        self._emit('disconnect', reason)
 
     def error(self, data):
         """Produces an `error` packet.
@@ -0,0 +1,172 @@
+import gevent
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Timeout(object):
+    __slots__ = ('wheel', 'callback', 'args', 'expires', 'slot', 'cancelled')
+
+    def __init__(self, wheel, callback, args, expires):
+        self.wheel = wheel
+        self.callback = callback
+        self.args = args
+
+        # Wheel tick the timeout fires on
+        self.expires = expires
+
+        self.slot = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancels the timeout, O(1)."""
+        if self.cancelled:
+            return
+
+        self.cancelled = True
+
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+
+            self.wheel.count -= 1
+
+
+class TimerWheel(object):
+    def __init__(self, resolution=0.1, size=256, levels=4):
+        """Hierarchical timer wheel, schedules any number of timeouts
+           from a single greenlet.
+
+        Each level has `size` slots, a slot of level `n` spans `size ** n`
+        ticks. Timeouts are placed on the lowest level covering their
+        delay and moved down a level as the lower wheel wraps around,
+        scheduling and cancelling are O(1) and each tick only visits the
+        timeouts due.
+
+        :param resolution: Seconds per tick
+        :type resolution: float
+
+        :param size: Number of slots per level
+        :type size: int
+
+        :param levels: Number of levels
+        :type levels: int
+        """
+        self.resolution = resolution
+        self.size = size
+        self.levels = levels
+
+        self.wheels = [[set() for x in range(size)] for y in range(levels)]
+        self.spans = [size ** level for level in range(levels + 1)]
+
+        self.count = 0
+
+        self.started = None
+        self.ticks = 0
+
+        self.runner = None
+
+    def schedule(self, delay, callback, *args):
+        """Schedules `callback(*args)` to be called after `delay` seconds.
+
+        :param delay: Delay in seconds
+        :type delay: float
+
+        :param callback: Callback function
+        :type callback: function
+
+        :rtype: Timeout
+        """
+        self.start()
+
+        ticks = max(int(round(delay / self.resolution)), 1)
+        timeout = Timeout(self, callback, args, self.ticks + ticks)
+
+        self.place(timeout)
+        self.count += 1
+
+        return timeout
+
+    def place(self, timeout):
+        """Adds a timeout to the slot covering its expiry."""
+        remaining = timeout.expires - self.ticks
+        spans = self.spans
+
+        level = 0
+
+        while level < self.levels - 1 and remaining >= spans[level + 1]:
+            level += 1
+
+        if remaining >= spans[level + 1]:
+            # Beyond the top level, placed in its last slot to visit
+            position = self.ticks // spans[level]
+        else:
+            position = timeout.expires // spans[level]
+
+        timeout.slot = self.wheels[level][position % self.size]
+        timeout.slot.add(timeout)
+
+    def start(self):
+        if self.runner is not None:
+            return
+
+        self.started = time.time()
+        self.ticks = 0
+
+        self.runner = gevent.spawn(self.run)
+
+    def run(self):
+        try:
+            while self.count > 0:
+                gevent.sleep(self.resolution)
+
+                # Catch up on ticks missed while the loop was busy
+                target = int((time.time() - self.started) / self.resolution)
+
+                while self.ticks < target and self.count > 0:
+                    self.tick()
+        finally:
+            self.runner = None
+
+    def tick(self):
+        """Advances the wheel by one tick, firing expired timeouts."""
+        self.ticks += 1
+
+        ticks = self.ticks
+        size = self.size
+
+        # Move timeouts down from the upper levels wrapping around
+        for level in range(self.levels - 1, 0, -1):
+            span = self.spans[level]
+
+            if ticks % span:
+                continue
+
+            slot = self.wheels[level][(ticks // span) % size]
+
+            if not slot:
+                continue
+
+            timeouts = list(slot)
+            slot.clear()
+
+            for timeout in timeouts:
+                self.place(timeout)
+
+        slot = self.wheels[0][ticks % size]
+
+        if not slot:
+            return
+
+        for timeout in list(slot):
+            slot.discard(timeout)
+            self.count -= 1
+
+            timeout.slot = None
+            timeout.cancelled = True
+
+            try:
+                timeout.callback(*timeout.args)
+            except Exception as ex:
+                log.warn('error in timer callback: %s', ex, exc_info=True)
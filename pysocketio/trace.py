@@ -0,0 +1,188 @@
+"""Hot-path tracing switches.
+
+Per-packet debug logging is guarded by a module flag per subsystem,
+disabled subsystems skip the logging call entirely:
+
+    if trace.client:
+        log.debug('writing packet %s', packet)
+
+Flags are toggled at runtime with `enable()`/`disable()`, or at startup
+with `PYSOCKETIO_TRACE=client,socket` (or `all`). Under `python -O`
+tracing can't be enabled, leaving a single flag check on the hot path.
+
+Sampled tracing records the lifecycle of 1 in N packets (decode,
+dispatch, encode, write...) and hands each finished `Trace` to a sink:
+
+    trace.sample(1000)
+"""
+from pysocketio.metrics import clock
+
+from collections import deque
+from itertools import count
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+SUBSYSTEMS = ['adapter', 'buffer', 'client', 'engine', 'namespace', 'socket']
+
+adapter = False
+buffer = False
+client = False
+engine = False
+namespace = False
+socket = False
+
+#: Active `Sampler` (`None` when sampling is disabled)
+sampler = None
+
+#: Recently finished traces
+recent = deque(maxlen=100)
+
+
+def enable(*subsystems):
+    """Enables debug logging on the hot path of `subsystems` (all if empty)."""
+    if not __debug__:
+        return
+
+    for name in subsystems or SUBSYSTEMS:
+        if name not in SUBSYSTEMS:
+            raise ValueError('Unknown subsystem %r' % name)
+
+        globals()[name] = True
+
+
+def disable(*subsystems):
+    """Disables debug logging on the hot path of `subsystems` (all if empty)."""
+    for name in subsystems or SUBSYSTEMS:
+        if name not in SUBSYSTEMS:
+            raise ValueError('Unknown subsystem %r' % name)
+
+        globals()[name] = False
+
+
+def sample(rate, sink=None):
+    """Traces 1 in `rate` packets (disabled if `rate` is falsy).
+
+    :param rate: Sampling rate
+    :type rate: int
+
+    :param sink: Callback function, called with each finished `Trace`
+                 (defaults to logging at INFO level)
+    :type sink: function
+    """
+    global sampler
+
+    if not rate or not __debug__:
+        sampler = None
+        return
+
+    sampler = Sampler(rate, sink or log_trace)
+
+
+def log_trace(trace):
+    log.info('%s', trace)
+
+
+def start(packet, kind, stage, detail=None):
+    """Samples a packet, attaching a `Trace` to `packet['trace']`
+       when selected. Call sites check `trace.sampler` first."""
+    trace = sampler.sample(kind, stage, detail)
+
+    if trace is not None:
+        packet['trace'] = trace
+
+
+class Trace(object):
+    __slots__ = ('id', 'kind', 'sink', 'events')
+
+    def __init__(self, id, kind, sink):
+        self.id = id
+        self.kind = kind
+        self.sink = sink
+
+        self.events = []
+
+    def mark(self, stage, detail=None):
+        """Records a lifecycle stage.
+
+        :param stage: Stage name
+        :type stage: str
+
+        :param detail: Stage detail
+        :type detail: object
+        """
+        self.events.append((clock(), stage, detail))
+
+    def finish(self, stage=None, detail=None):
+        """Records the final stage and hands the trace to its sink."""
+        if stage is not None:
+            self.mark(stage, detail)
+
+        recent.append(self)
+
+        try:
+            self.sink(self)
+        except Exception as ex:
+            log.warn('error in trace sink: %s', ex)
+
+    def __str__(self):
+        if not self.events:
+            return 'trace %s (%s)' % (self.id, self.kind)
+
+        started = self.events[0][0]
+
+        return 'trace %s (%s): %s' % (self.id, self.kind, ', '.join([
+            '%s +%.6fs%s' % (stage, at - started, ' %s' % (detail,) if detail is not None else '')
+            for at, stage, detail in self.events
+        ]))
+
+
+class Sampler(object):
+    def __init__(self, rate, sink):
+        self.rate = rate
+        self.sink = sink
+
+        self.ids = count(1)
+        self.counter = 0
+
+    def sample(self, kind, stage, detail=None):
+        """Starts a trace for 1 in `rate` calls, returns `None` otherwise.
+
+        :param kind: Trace kind (`inbound`, `outbound`)
+        :type kind: str
+
+        :param stage: First stage name
+        :type stage: str
+        """
+        self.counter += 1
+
+        if self.counter < self.rate:
+            return None
+
+        self.counter = 0
+
+        trace = Trace(next(self.ids), kind, self.sink)
+        trace.mark(stage, detail)
+
+        return trace
+
+
+def _configure():
+    subsystems = os.environ.get('PYSOCKETIO_TRACE')
+
+    if subsystems:
+        names = [x.strip() for x in subsystems.split(',') if x.strip()]
+
+        if 'all' in names:
+            enable()
+        elif names:
+            enable(*names)
+
+    rate = os.environ.get('PYSOCKETIO_TRACE_SAMPLE')
+
+    if rate:
+        sample(int(rate))
+
+
+_configure()
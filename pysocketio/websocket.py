@@ -0,0 +1,137 @@
+"""gevent-websocket handler negotiating permessage-deflate.
+
+Used by `pysocketio.Server` when the engine `compression` option is set.
+"""
+from geventwebsocket.exceptions import ProtocolError, WebSocketError
+from geventwebsocket.handler import WebSocketHandler
+from geventwebsocket.websocket import Header, WebSocket, MSG_CLOSED, MSG_SOCKET_DEAD
+from socket import error as socket_error
+import logging
+
+log = logging.getLogger(__name__)
+
+RSV1 = Header.RSV0_MASK
+
+TEXT_TYPES = (type(u''),)
+
+
+class DeflateWebSocket(WebSocket):
+    def __init__(self, environ, stream, handler, deflate, params):
+        """WebSocket compressing text/binary messages above the
+           configured threshold, and inflating compressed messages.
+
+        :param deflate: Configuration
+        :type deflate: pysocketio.compression.Deflate
+
+        :param params: Negotiated connection parameters
+        :type params: dict
+        """
+        super(DeflateWebSocket, self).__init__(environ, stream, handler)
+
+        self.compressor = deflate.compressor(params)
+        self.decompressor = deflate.decompressor(params)
+
+        # Current message is compressed
+        self.inflating = False
+
+    def read_frame(self):
+        header = Header.decode_header(self.stream)
+
+        compressed = bool(header.flags & RSV1)
+        header.flags &= ~RSV1
+
+        if header.flags:
+            raise ProtocolError
+
+        if compressed:
+            # Only the first frame of a data message is flagged
+            if header.opcode not in (self.OPCODE_TEXT, self.OPCODE_BINARY) or self.inflating:
+                raise ProtocolError
+
+            self.inflating = True
+
+        if not header.length:
+            payload = b''
+        else:
+            try:
+                payload = self.raw_read(header.length)
+            except socket_error:
+                payload = b''
+            except Exception:
+                raise WebSocketError(MSG_CLOSED)
+
+            if len(payload) != header.length:
+                raise WebSocketError('Unexpected EOF reading frame payload')
+
+            if header.mask:
+                payload = header.unmask_payload(payload)
+
+        if self.inflating and header.opcode < self.OPCODE_CLOSE:
+            try:
+                payload = self.decompressor.decompress(payload, header.fin)
+            except Exception as ex:
+                log.debug('unable to inflate message: %s', ex)
+                raise ProtocolError('Invalid compressed message')
+
+            if header.fin:
+                self.inflating = False
+
+            header.length = len(payload)
+
+        return header, payload
+
+    def send_frame(self, message, opcode):
+        if opcode not in (self.OPCODE_TEXT, self.OPCODE_BINARY) or not message:
+            return super(DeflateWebSocket, self).send_frame(message, opcode)
+
+        if self.closed:
+            raise WebSocketError(MSG_SOCKET_DEAD)
+
+        if isinstance(message, TEXT_TYPES):
+            message = message.encode('utf-8')
+        elif opcode == self.OPCODE_BINARY:
+            message = bytes(message)
+
+        flags = 0
+        compressed = self.compressor.compress(message)
+
+        if compressed is not None:
+            message = compressed
+            flags = RSV1
+
+        header = Header.encode_header(True, opcode, b'', len(message), flags)
+
+        try:
+            self.raw_write(header + message)
+        except socket_error:
+            raise WebSocketError(MSG_SOCKET_DEAD)
+
+
+class DeflateHandler(WebSocketHandler):
+    def upgrade_connection(self):
+        deflate = getattr(self.server, 'deflate', None)
+        accepted = None
+
+        if deflate is not None:
+            accepted = deflate.negotiate(self.environ.get('HTTP_SEC_WEBSOCKET_EXTENSIONS'))
+
+        self.extension = accepted[0] if accepted else None
+
+        result = super(DeflateHandler, self).upgrade_connection()
+
+        if accepted is None or getattr(self, 'websocket', None) is None:
+            return result
+
+        self.websocket = DeflateWebSocket(
+            self.environ, self.websocket.stream, self,
+            deflate, accepted[1]
+        )
+
+        self.environ['wsgi.websocket'] = self.websocket
+        return result
+
+    def start_response(self, status, headers, exc_info=None):
+        if status.startswith('101') and getattr(self, 'extension', None):
+            headers = list(headers) + [('Sec-WebSocket-Extensions', self.extension)]
+
+        return super(DeflateHandler, self).start_response(status, headers, exc_info)
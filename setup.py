@@ -9,13 +9,12 @@ setup(
     author_email='me@dgardiner.net',
 
     description='Python implementation of socket.io',
-    packages=['pysocketio'],
+    packages=['pysocketio', 'pysocketio.cluster'],
     platforms='any',
 
     install_requires=[
         'PyEmitter',
         'PyEngineIO',
-        'PySocketIO-Adapter',
         'PySocketIO-Parser',
 
         'gevent',